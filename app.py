@@ -1,8 +1,15 @@
+import logging
+
 from config import GRADIO_SERVER_NAME, GRADIO_SERVER_PORT
+from janitor import _start_janitor
+from rembg_tools import _start_rembg_preload
 from ui import build_demo
 
 
 def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    _start_rembg_preload()
+    _start_janitor()
     demo = build_demo()
     demo.launch(
         server_name=GRADIO_SERVER_NAME,
@@ -0,0 +1,114 @@
+import os
+import hashlib
+import threading
+import uuid
+from typing import Optional
+
+
+def _file_digest(path: str, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _cache_key(*parts) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode("utf-8")
+        elif not isinstance(part, (bytes, bytearray, memoryview)):
+            part = repr(part).encode("utf-8")
+        h.update(len(part).to_bytes(8, "little"))
+        h.update(part)
+    return h.hexdigest()
+
+
+class DiskLRUCache:
+    """
+    目录里一个 key 一个文件的 LRU 缓存：命中时刷新 mtime，
+    总大小超过 max_bytes 时按 mtime 从旧到新删除。
+    多个进程共用同一目录也安全（写入用临时文件 + os.replace）。
+    """
+
+    def __init__(self, root: str, max_bytes: int, suffix: str = ".bin"):
+        self.root = root
+        self.max_bytes = int(max_bytes)
+        self.suffix = suffix
+        self._lock = threading.Lock()
+        self._used: Optional[int] = None
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, f"{key}{self.suffix}")
+
+    def _entries(self):
+        out = []
+        try:
+            with os.scandir(self.root) as it:
+                for e in it:
+                    if not e.name.endswith(self.suffix) or not e.is_file():
+                        continue
+                    try:
+                        st = e.stat()
+                    except OSError:
+                        continue
+                    out.append((st.st_mtime, st.st_size, e.path))
+        except OSError:
+            pass
+        return out
+
+    def get(self, key: str) -> Optional[bytes]:
+        p = self._path(key)
+        try:
+            with open(p, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        try:
+            os.utime(p, None)
+        except OSError:
+            pass
+        return data
+
+    def put(self, key: str, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        p = self._path(key)
+        tmp = f"{p}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, p)
+        except OSError:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            return
+        with self._lock:
+            if self._used is None:
+                self._used = sum(size for _, size, _ in self._entries())
+            else:
+                self._used += len(data)
+            if self._used > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Rescan: other processes may have written or evicted in the meantime.
+        entries = sorted(self._entries())
+        used = sum(size for _, size, _ in entries)
+        target = int(self.max_bytes * 0.9)
+        for _, size, p in entries:
+            if used <= target:
+                break
+            try:
+                os.remove(p)
+            except OSError:
+                continue
+            used -= size
+        self._used = used
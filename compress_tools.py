@@ -9,7 +9,8 @@ from file_utils import (
     _save_image_bytes,
     _pick_color,
     _write_preview,
-    _zip_bytes,
+    _ZipStream,
+    _imap_ordered,
 )
 
 
@@ -31,11 +32,24 @@ def _resolve_compress_format(choice: str, img_format: Optional[str], path: str)
     return "PNG"
 
 
+def _compress_one(p: str, out_format: str, quality: int, bg, preset: Optional[str]):
+    base = os.path.splitext(os.path.basename(p))[0]
+    try:
+        with Image.open(p) as img:
+            fmt = _resolve_compress_format(out_format, img.format, p)
+            out_bytes = _save_image_bytes(img, fmt, quality=int(quality), bg_color=bg, preset=preset)
+    except Exception as e:
+        return None, None, f"[{base}] compress/export failed: {e}"
+    ext = fmt.lower().replace("jpeg", "jpg")
+    return f"{base}_compressed.{ext}", out_bytes, None
+
+
 def batch_compress(
     input_files: Any,
     out_format: str,
     quality: int,
     jpg_bg: str,
+    preset: Optional[str] = None,
 ):
     input_paths = _normalize_files(input_files)
     if not input_paths:
@@ -43,23 +57,22 @@ def batch_compress(
 
     bg = _pick_color(jpg_bg, (255, 255, 255))
     outputs_gallery = []
-    outputs_zip_items = []
+    zip_out = _ZipStream()
     logs = []
 
-    for p in input_paths:
-        base = os.path.splitext(os.path.basename(p))[0]
-        try:
-            with Image.open(p) as img:
-                fmt = _resolve_compress_format(out_format, img.format, p)
-                out_bytes = _save_image_bytes(img, fmt, quality=int(quality), bg_color=bg)
-        except Exception as e:
-            logs.append(f"[{base}] compress/export failed: {e}")
-            continue
+    def _one(p):
+        name, out_bytes, log = _compress_one(p, out_format, quality, bg, preset)
+        if out_bytes is None:
+            return name, None, None, log
+        return name, out_bytes, _write_preview(name, out_bytes), None
 
-        ext = fmt.lower().replace("jpeg", "jpg")
-        name = f"{base}_compressed.{ext}"
-        outputs_zip_items.append((name, out_bytes))
-        outputs_gallery.append(_write_preview(name, out_bytes))
+    # Decode + encode + thumbnail per image on the encode pool; results come back in input order.
+    for name, out_bytes, preview, log in _imap_ordered(_one, input_paths):
+        if out_bytes is None:
+            logs.append(log)
+            continue
+        zip_out.add(name, out_bytes)
+        outputs_gallery.append(preview)
 
-    zip_path = _zip_bytes(outputs_zip_items)
+    zip_path = zip_out.close()
     return outputs_gallery, zip_path, ("\n".join(logs) if logs else "OK")
@@ -2,27 +2,133 @@ import os
 
 os.environ.setdefault("GRADIO_ANALYTICS_ENABLED", "False")
 
+
+def _env_bool(key: str, default: bool) -> bool:
+    val = os.getenv(key)
+    if val is None or not val.strip():
+        return default
+    return val.strip().lower() not in ("0", "false", "no", "off")
+
+
 MAX_CONCURRENCY = 2
-LAMA_SERVER = os.getenv("LAMA_SERVER", "http://127.0.0.1:8090")
+
+
+def _parse_lama_servers(val: str):
+    # "http://a:8090*4,http://b:8090" -> [("http://a:8090", 4), ("http://b:8090", MAX_CONCURRENCY)]
+    out = []
+    for part in val.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        url, _, limit = part.partition("*")
+        url = url.strip().rstrip("/")
+        try:
+            n = max(1, int(limit)) if limit.strip() else MAX_CONCURRENCY
+        except ValueError:
+            n = MAX_CONCURRENCY
+        out.append((url, n))
+    return out or [("http://127.0.0.1:8090", MAX_CONCURRENCY)]
+
+
+LAMA_SERVERS = _parse_lama_servers(os.getenv("LAMA_SERVER", "http://127.0.0.1:8090"))
+LAMA_SERVER = LAMA_SERVERS[0][0]
+LAMA_HEALTH_INTERVAL = float(os.getenv("LAMA_HEALTH_INTERVAL", "15"))
+# Transient failures (timeouts, connection errors, 429/502/503/504) are retried with jittered backoff.
+LAMA_RETRIES = max(0, int(os.getenv("LAMA_RETRIES", "2")))
+LAMA_RETRY_BACKOFF = float(os.getenv("LAMA_RETRY_BACKOFF", "0.5"))
+# Circuit breaker: after N consecutive failures a backend is skipped for the cooldown.
+LAMA_BREAKER_FAILURES = max(1, int(os.getenv("LAMA_BREAKER_FAILURES", "5")))
+LAMA_BREAKER_COOLDOWN = float(os.getenv("LAMA_BREAKER_COOLDOWN", "30"))
+# AIMD: halve in-flight limit when latency exceeds this multiple of the running average.
+LAMA_AIMD_SLOW_FACTOR = float(os.getenv("LAMA_AIMD_SLOW_FACTOR", "2.0"))
 LAMA_CONNECT_TIMEOUT = float(os.getenv("LAMA_CONNECT_TIMEOUT", "5"))
 LAMA_TIMEOUT = float(os.getenv("LAMA_TIMEOUT", "120"))
+LAMA_MAX_CONNECTIONS = max(1, int(os.getenv("LAMA_MAX_CONNECTIONS", str(sum(n for _, n in LAMA_SERVERS)))))
+LAMA_KEEPALIVE_EXPIRY = float(os.getenv("LAMA_KEEPALIVE_EXPIRY", "60"))
+# Send only the mask bounding box plus this much context to /inpaint.
+LAMA_CROP_TO_MASK = _env_bool("LAMA_CROP_TO_MASK", True)
+LAMA_CROP_MARGIN = max(0, int(os.getenv("LAMA_CROP_MARGIN", "196")))
+# Crops covering more than this share of the image are sent whole.
+LAMA_CROP_MAX_RATIO = float(os.getenv("LAMA_CROP_MAX_RATIO", "0.6"))
+# Editor masks: a pixel counts as painted above this alpha (or luminance for opaque layers).
+LAMA_MASK_THRESHOLD = max(0, min(254, int(os.getenv("LAMA_MASK_THRESHOLD", "10"))))
+# Grow the mask by this many px before inpainting; feather blends cropped results back over this many px.
+LAMA_MASK_DILATE = max(0, int(os.getenv("LAMA_MASK_DILATE", "0")))
+LAMA_MASK_FEATHER = max(0, int(os.getenv("LAMA_MASK_FEATHER", "0")))
+# Local OpenCV inpaint (needs opencv-python-headless): masks up to this many px skip lama; 0 = never.
+LOCAL_INPAINT_MAX_AREA = max(0, int(os.getenv("LOCAL_INPAINT_MAX_AREA", "0")))
+# Use the local engine when the circuit breaker of every lama backend is open.
+LOCAL_INPAINT_FALLBACK = _env_bool("LOCAL_INPAINT_FALLBACK", True)
+LOCAL_INPAINT_METHOD = os.getenv("LOCAL_INPAINT_METHOD", "telea").strip().lower()
+LOCAL_INPAINT_RADIUS = max(1, int(os.getenv("LOCAL_INPAINT_RADIUS", "5")))
+# Upload encoding: zlib level for PNGs built for lama (0-9, low = fast), and source formats sent as-is.
+LAMA_PNG_LEVEL = max(0, min(9, int(os.getenv("LAMA_PNG_LEVEL", "1"))))
+LAMA_PASSTHROUGH_FORMATS = {
+    f.strip().upper().replace("JPG", "JPEG")
+    for f in os.getenv("LAMA_PASSTHROUGH_FORMATS", "PNG,JPEG").split(",")
+    if f.strip()
+}
+# HTTP/2 needs the h2 package (pip install httpx[http2]); ignored otherwise.
+LAMA_HTTP2 = _env_bool("LAMA_HTTP2", False)
 GRADIO_SERVER_NAME = os.getenv("GRADIO_SERVER_NAME", "0.0.0.0")
 GRADIO_SERVER_PORT = int(os.getenv("GRADIO_SERVER_PORT", "7860"))
-EDITOR_SLOTS = 8
+# Mask editors per page; uploads beyond this are paged, not dropped.
+EDITOR_SLOTS = max(1, int(os.getenv("EDITOR_SLOTS", "8")))
 PREVIEW_HEIGHT = 520
+# Long side of result thumbnails shown in galleries; full-size files only go into the ZIP.
+PREVIEW_THUMB_SIZE = max(64, int(os.getenv("PREVIEW_THUMB_SIZE", "512")))
 EDITOR_HEIGHT = PREVIEW_HEIGHT + 100
 EDITOR_CANVAS_SIZE = (PREVIEW_HEIGHT, PREVIEW_HEIGHT)
 REMBG_MODEL_PATH = os.getenv("REMBG_MODEL_PATH", "").strip()
+REMBG_BATCH_SIZE = max(1, int(os.getenv("REMBG_BATCH_SIZE", "4")))
+REMBG_WORKERS = max(0, int(os.getenv("REMBG_WORKERS", "0")))
+# Decode for segmentation at most this long side, then upsample the mask; 0 = full decode.
+REMBG_INFER_MAX_SIDE = max(0, int(os.getenv("REMBG_INFER_MAX_SIDE", "1600")))
+# Opt-in contrast curve on upsampled masks: crisper edges, but flattens hair/glass/shadow transparency.
+REMBG_EDGE_SHARPEN = _env_bool("REMBG_EDGE_SHARPEN", False)
+# ONNX Runtime session options; 0 threads = auto (intra: cores split across concurrent jobs).
+REMBG_INTRA_OP_THREADS = max(0, int(os.getenv("REMBG_INTRA_OP_THREADS", "0")))
+REMBG_INTER_OP_THREADS = max(0, int(os.getenv("REMBG_INTER_OP_THREADS", "1")))
+REMBG_GRAPH_OPT = os.getenv("REMBG_GRAPH_OPT", "all").strip().lower()
+REMBG_MEM_ARENA = _env_bool("REMBG_MEM_ARENA", True)
+# Comma-separated model choices to load and warm up in the background at startup.
+REMBG_PRELOAD = [m.strip() for m in os.getenv("REMBG_PRELOAD", "").split(",") if m.strip()]
+REMBG_SESSION_BUDGET_MB = max(0, int(os.getenv("REMBG_SESSION_BUDGET_MB", "1536")))
+REMBG_SESSION_ERR_TTL = float(os.getenv("REMBG_SESSION_ERR_TTL", "60"))
 MODELS_DIR = os.path.abspath("./models")
 
 OUT_DIR = os.path.abspath("./_outputs")
 os.makedirs(OUT_DIR, exist_ok=True)
+REMBG_MASK_CACHE_DIR = os.path.join(OUT_DIR, "rembg_masks")
+REMBG_MASK_CACHE_MB = max(0, int(os.getenv("REMBG_MASK_CACHE_MB", "512")))
+LAMA_CACHE_DIR = os.path.join(OUT_DIR, "inpaint_cache")
+LAMA_CACHE_MB = max(0, int(os.getenv("LAMA_CACHE_MB", "1024")))
+# Janitor for files directly in OUT_DIR (previews, ZIPs, editor images); cache subdirs manage themselves.
+OUT_DIR_TTL_HOURS = max(0.0, float(os.getenv("OUT_DIR_TTL_HOURS", "24")))
+OUT_DIR_MAX_MB = max(0, int(os.getenv("OUT_DIR_MAX_MB", "2048")))
+# Files handed to the UI are kept at least this long after their last use.
+OUT_DIR_LEASE_SECONDS = max(0.0, float(os.getenv("OUT_DIR_LEASE_SECONDS", "3600")))
+OUT_DIR_JANITOR_INTERVAL = float(os.getenv("OUT_DIR_JANITOR_INTERVAL", "600"))
 os.makedirs(MODELS_DIR, exist_ok=True)
 os.environ.setdefault("U2NET_HOME", MODELS_DIR)
 
+# Encoder speed/size trade-off for exported images; selectable per tab.
+ENCODE_PRESETS = ["fast", "balanced", "smallest"]
+ENCODE_PRESET_DEFAULT = os.getenv("ENCODE_PRESET", "balanced").strip().lower()
+if ENCODE_PRESET_DEFAULT not in ENCODE_PRESETS:
+    ENCODE_PRESET_DEFAULT = "balanced"
+ENCODE_WORKERS = max(1, int(os.getenv("ENCODE_WORKERS", "0")) or (os.cpu_count() or 2))
+# Batch resize: images in flight at once (on the encode pool) and the decoded-pixel budget they may use.
+RESIZE_WORKERS = max(1, int(os.getenv("RESIZE_WORKERS", "0")) or ENCODE_WORKERS)
+RESIZE_MEMORY_MB = max(0, int(os.getenv("RESIZE_MEMORY_MB", "1024")))
+
 COMPRESS_FORMAT_AUTO = "自动（保持原格式）"
 COMPRESS_FORMAT_CHOICES = [COMPRESS_FORMAT_AUTO, "WEBP", "JPG", "PNG"]
 EDITOR_ZOOM_CHOICES = [1, 2, 3]
+# Zoom editor shows a viewport of at most this many pixels per side instead of the whole upscaled image.
+ZOOM_VIEW_SIZE = max(256, int(os.getenv("ZOOM_VIEW_SIZE", "1024")))
+# Decoded full-size sources kept in memory for panning/re-opening the zoom editor.
+ZOOM_CACHE_MB = max(0, int(os.getenv("ZOOM_CACHE_MB", "512")))
 
 # Ensure localhost bypasses any proxy to avoid Gradio url_ok failure.
 def _ensure_no_proxy():
@@ -3,11 +3,22 @@ import io
 import zipfile
 import uuid
 import hashlib
-from typing import List, Tuple, Optional, Any
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, List, Tuple, Optional, Any
 
 from PIL import Image
 
-from config import OUT_DIR
+from config import (
+    OUT_DIR,
+    ENCODE_PRESET_DEFAULT,
+    ENCODE_WORKERS,
+    PREVIEW_THUMB_SIZE,
+    ZOOM_VIEW_SIZE,
+    ZOOM_CACHE_MB,
+)
+from janitor import _lease
 
 
 # ----------------------------
@@ -81,7 +92,107 @@ def _to_pil(x: Any) -> Image.Image:
     raise TypeError(f"Unsupported type: {type(x)}")
 
 
-def _save_image_bytes(img: Image.Image, fmt: str, quality: int = 92, bg_color=(255, 255, 255)) -> bytes:
+class _ImageHandle:
+    """
+    一张图片在处理链路里的句柄：文件只读一次，文件头（尺寸/模式/格式）只解析一次，
+    像素按需解码且最多解码一次；只有内存图时按需编码成 PNG 字节。
+    """
+
+    def __init__(self, path: Optional[str] = None, data: Optional[bytes] = None, image: Optional[Image.Image] = None):
+        if path is None and data is None and image is None:
+            raise ValueError("Empty image")
+        self.path = path
+        self._data = data
+        self._image = image
+        self._header: Optional[Tuple[Tuple[int, int], str, Optional[str]]] = None
+        if image is not None:
+            self._header = (image.size, image.mode, image.format)
+
+    @classmethod
+    def from_path(cls, path: str) -> "_ImageHandle":
+        return cls(path=path)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "_ImageHandle":
+        return cls(data=data)
+
+    @classmethod
+    def from_image(cls, image: Image.Image) -> "_ImageHandle":
+        return cls(image=image)
+
+    def load(self) -> "_ImageHandle":
+        """读入文件字节（不解码像素），读失败时在这里就抛出。"""
+        if self._data is None and self.path is not None:
+            with open(self.path, "rb") as f:
+                self._data = f.read()
+        return self
+
+    @property
+    def data(self) -> bytes:
+        if self._data is None:
+            if self.path is not None:
+                self.load()
+            else:
+                buf = io.BytesIO()
+                self._image.save(buf, format="PNG", compress_level=1)
+                self._data = buf.getvalue()
+        return self._data
+
+    def _open(self) -> Image.Image:
+        return Image.open(io.BytesIO(self.data))
+
+    def _read_header(self):
+        if self._header is None:
+            # Image.open only parses the header; pixels stay undecoded.
+            # Read it from the file when the bytes have not been loaded yet.
+            src = self.path if self._data is None and self.path is not None else io.BytesIO(self.data)
+            with Image.open(src) as img:
+                self._header = (img.size, img.mode, img.format)
+        return self._header
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        return self._read_header()[0]
+
+    @property
+    def mode(self) -> str:
+        return self._read_header()[1]
+
+    @property
+    def format(self) -> Optional[str]:
+        return self._read_header()[2]
+
+    @property
+    def image(self) -> Image.Image:
+        if self._image is None:
+            img = self._open()
+            img.load()
+            self._image = img
+        return self._image
+
+
+# fast: lowest CPU; balanced: Pillow defaults plus cheap JPEG optimize; smallest: the old always-on settings.
+_ENCODE_PRESETS = {
+    "fast": {"png": {"compress_level": 1}, "jpeg": {}, "webp": {"method": 1}},
+    "balanced": {"png": {"compress_level": 6}, "jpeg": {"optimize": True}, "webp": {"method": 4}},
+    "smallest": {"png": {"optimize": True}, "jpeg": {"optimize": True}, "webp": {"method": 6}},
+}
+_ENCODE_POOL: Optional[ThreadPoolExecutor] = None
+_ENCODE_POOL_LOCK = threading.Lock()
+
+
+def _encode_options(preset: Optional[str], fmt: str) -> dict:
+    opts = _ENCODE_PRESETS.get(preset or ENCODE_PRESET_DEFAULT) or _ENCODE_PRESETS["balanced"]
+    return dict(opts[fmt])
+
+
+def _save_image_bytes(
+    img: Image.Image,
+    fmt: str,
+    quality: int = 92,
+    bg_color=(255, 255, 255),
+    preset: Optional[str] = None,
+) -> bytes:
     fmt = (fmt or "PNG").upper()
     buf = io.BytesIO()
 
@@ -93,34 +204,159 @@ def _save_image_bytes(img: Image.Image, fmt: str, quality: int = 92, bg_color=(2
             img = bg
         else:
             img = img.convert("RGB")
-        img.save(buf, format="JPEG", quality=int(quality), optimize=True)
+        img.save(buf, format="JPEG", quality=int(quality), **_encode_options(preset, "jpeg"))
     elif fmt == "WEBP":
-        img.save(buf, format="WEBP", quality=int(quality), method=6)
+        img.save(buf, format="WEBP", quality=int(quality), **_encode_options(preset, "webp"))
     else:
         if img.mode not in ("RGBA", "RGB", "LA", "L"):
             img = img.convert("RGBA")
-        img.save(buf, format="PNG", optimize=True)
+        img.save(buf, format="PNG", **_encode_options(preset, "png"))
 
     return buf.getvalue()
 
 
+def _get_encode_pool() -> ThreadPoolExecutor:
+    # Pillow's codecs and most resampling release the GIL, so threads scale.
+    global _ENCODE_POOL
+    with _ENCODE_POOL_LOCK:
+        if _ENCODE_POOL is None:
+            _ENCODE_POOL = ThreadPoolExecutor(max_workers=ENCODE_WORKERS, thread_name_prefix="encode")
+        return _ENCODE_POOL
+
+
+def _imap_ordered(
+    fn: Callable[[Any], Any],
+    items: Iterable[Any],
+    window: Optional[int] = None,
+    cost: Optional[Callable[[Any], int]] = None,
+    budget: int = 0,
+) -> Iterator[Any]:
+    """
+    在编码线程池里执行 fn(item)，按输入顺序逐个产出结果；
+    同时在途的任务不超过 window 个，内存里只保留这几张图。
+    给了 cost/budget 时，在途任务的 cost 之和也不超过 budget（至少保留一个在途）。
+    """
+    pool = _get_encode_pool()
+    window = max(1, window or ENCODE_WORKERS)
+    pending = deque()
+    in_flight = 0
+    for item in items:
+        c = cost(item) if cost else 0
+        while pending and (len(pending) >= window or (budget > 0 and in_flight + c > budget)):
+            fut, fc = pending.popleft()
+            in_flight -= fc
+            yield fut.result()
+        pending.append((pool.submit(fn, item), c))
+        in_flight += c
+    while pending:
+        yield pending.popleft()[0].result()
+
+
+# Already-compressed formats: DEFLATE costs CPU and saves almost nothing.
+_ZIP_STORED_EXTS = {".png", ".jpg", ".jpeg", ".webp", ".gif"}
+
+
+class _ZipStream:
+    """
+    边处理边写的 ZIP：每个结果编码完就 add() 写入磁盘，调用方随即释放字节，
+    整批只在内存里保留当前这张；png/jpg/webp 直接存储不再压缩。
+    add() 可在多个线程里调用。
+    """
+
+    def __init__(self):
+        self.path = os.path.join(OUT_DIR, f"batch_{uuid.uuid4().hex}.zip")
+        _lease([self.path])
+        self.count = 0
+        self._zip: Optional[zipfile.ZipFile] = None
+        self._names = set()
+        self._lock = threading.Lock()
+
+    def _unique_name(self, name: str) -> str:
+        stem, ext = os.path.splitext(name)
+        n = 1
+        while name in self._names:
+            n += 1
+            name = f"{stem}_{n}{ext}"
+        self._names.add(name)
+        return name
+
+    def add(self, name: str, data: bytes):
+        stored = os.path.splitext(name)[1].lower() in _ZIP_STORED_EXTS
+        compress_type = zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED
+        with self._lock:
+            if self._zip is None:
+                self._zip = zipfile.ZipFile(self.path, "w", compression=zipfile.ZIP_DEFLATED)
+            self._zip.writestr(self._unique_name(name), data, compress_type=compress_type)
+            self.count += 1
+
+    def close(self) -> Optional[str]:
+        """关闭并返回 ZIP 路径；没有写入任何文件时返回 None。"""
+        with self._lock:
+            if self._zip is None:
+                return None
+            self._zip.close()
+            self._zip = None
+        _lease([self.path])
+        return self.path
+
+    def __enter__(self) -> "_ZipStream":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
 def _zip_bytes(files: List[Tuple[str, bytes]]) -> Optional[str]:
-    if not files:
-        return None
-    zip_path = os.path.join(OUT_DIR, f"batch_{uuid.uuid4().hex}.zip")
-    with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_DEFLATED) as z:
-        for name, b in files:
-            z.writestr(name, b)
-    return zip_path
+    zs = _ZipStream()
+    for name, b in files:
+        zs.add(name, b)
+    return zs.close()
 
 
-def _write_preview(name: str, b: bytes) -> str:
-    p = os.path.join(OUT_DIR, f"{uuid.uuid4().hex}_{name}")
-    with open(p, "wb") as f:
-        f.write(b)
+def _preview_thumb(b: bytes, image: Optional[Image.Image] = None) -> Image.Image:
+    # PNG is lossless, so the pixels that were encoded can be used as-is.
+    if image is None or not b.startswith(b"\x89PNG"):
+        image = Image.open(io.BytesIO(b))
+    w, h = image.size
+    scale = min(1.0, PREVIEW_THUMB_SIZE / max(w, h, 1))
+    size = (max(1, round(w * scale)), max(1, round(h * scale)))
+    if scale < 1:
+        image.draft(image.mode, size)  # JPEG: decode at 1/2..1/8 scale
+        image = image.resize(size, Image.BILINEAR, reducing_gap=2.0)
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA")
+    return image
+
+
+def _write_preview(name: str, b: bytes, image: Optional[Image.Image] = None) -> str:
+    """
+    Gallery 预览：只写长边 PREVIEW_THUMB_SIZE 的 WEBP 缩略图，原图只进 ZIP。
+    image 为编码前的图，PNG 输出时直接用它缩放，省去再解码一次。
+    """
+    stem = os.path.splitext(name)[0]
+    p = os.path.join(OUT_DIR, f"{uuid.uuid4().hex}_{stem}.webp")
+    try:
+        _preview_thumb(b, image).save(p, format="WEBP", quality=80, method=0)
+    except Exception:
+        p = os.path.join(OUT_DIR, f"{uuid.uuid4().hex}_{name}")
+        with open(p, "wb") as f:
+            f.write(b)
+    _lease([p])
     return p
 
 
+def _reuse_derived(path: str) -> bool:
+    # Cached editor images: mark as recently used so the janitor keeps them.
+    if not os.path.isfile(path):
+        return False
+    try:
+        os.utime(path, None)
+    except OSError:
+        pass
+    _lease([path])
+    return True
+
+
 def _pick_color(name: str, default=(255, 255, 255)):
     if isinstance(name, (tuple, list)) and len(name) == 3:
         try:
@@ -178,13 +414,14 @@ def _pad_to_target(img: Image.Image, w: int, h: int, pad_color) -> Image.Image:
     return canvas
 
 
-def _editor_zoom_path(src_path: str, zoom: int) -> str:
+def _editor_zoom_path(src_path: str, zoom: int, box: Tuple[int, int, int, int]) -> str:
     try:
         mtime = int(os.path.getmtime(src_path))
     except Exception:
         mtime = 0
     key = hashlib.md5(src_path.encode("utf-8")).hexdigest()[:12]
-    return os.path.join(OUT_DIR, f"editor_zoom_{key}_{zoom}x_{mtime}.png")
+    x0, y0, x1, y1 = box
+    return os.path.join(OUT_DIR, f"editor_zoom_{key}_{zoom}x_{x0}_{y0}_{x1}_{y1}_{mtime}.png")
 
 
 def _editor_fit_path(src_path: str, max_w: int, max_h: int) -> str:
@@ -204,31 +441,92 @@ def _make_editor_image(src_path: str, max_size: Tuple[int, int]) -> str:
     if max_w <= 0 or max_h <= 0:
         return src_path
     out_path = _editor_fit_path(src_path, max_w, max_h)
-    if os.path.isfile(out_path):
+    if _reuse_derived(out_path):
         return out_path
     try:
         with Image.open(src_path) as img:
             if img.width <= max_w and img.height <= max_h:
                 return src_path
-            img.thumbnail((max_w, max_h), Image.LANCZOS)
-            img.save(out_path, format="PNG", optimize=True)
+            scale = min(max_w / img.width, max_h / img.height)
+            size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+            # JPEG: decode straight at 1/2..1/8 scale; others shrink with reduce() before LANCZOS.
+            img.draft(img.mode, size)
+            fit = img.resize(size, Image.LANCZOS, reducing_gap=2.0)
+            fit.save(out_path, format="PNG", compress_level=1)
+        _lease([out_path])
         return out_path
     except Exception:
         return src_path
 
 
-def _make_zoom_image(src_path: str, zoom: int) -> str:
-    if not zoom or zoom <= 1:
-        return src_path
-    out_path = _editor_zoom_path(src_path, zoom)
-    if os.path.isfile(out_path):
-        return out_path
+# (path, mtime) -> decoded full-size source, least recently used first.
+_ZOOM_SOURCES: "OrderedDict[Tuple[str, float], Image.Image]" = OrderedDict()
+_ZOOM_SOURCES_LOCK = threading.Lock()
+
+
+def _image_nbytes(img: Image.Image) -> int:
+    return img.width * img.height * len(img.getbands())
+
+
+def _zoom_source(src_path: str) -> Image.Image:
+    # Panning and re-opening the zoom editor crop from the same decoded image.
+    key = (src_path, os.path.getmtime(src_path))
+    with _ZOOM_SOURCES_LOCK:
+        img = _ZOOM_SOURCES.get(key)
+        if img is not None:
+            _ZOOM_SOURCES.move_to_end(key)
+            return img
+    with Image.open(src_path) as f:
+        f.load()
+        img = f if f.mode in ("RGB", "RGBA", "L", "LA") else f.convert("RGBA")
+    budget = ZOOM_CACHE_MB * 1024 * 1024
+    if _image_nbytes(img) > budget:
+        return img
+    with _ZOOM_SOURCES_LOCK:
+        _ZOOM_SOURCES[key] = img
+        while sum(_image_nbytes(v) for v in _ZOOM_SOURCES.values()) > budget:
+            _ZOOM_SOURCES.popitem(last=False)
+    return img
+
+
+def _zoom_view_box(size: Tuple[int, int], zoom: int, center: Optional[Tuple[float, float]] = None) -> Tuple[int, int, int, int]:
+    """放大编辑视口：源图中以 center（0~1 相对坐标）为中心、放大后不超过 ZOOM_VIEW_SIZE 的区域。"""
+    w, h = size
+    side = max(1, ZOOM_VIEW_SIZE // max(1, zoom))
+    bw, bh = min(w, side), min(h, side)
+    cx, cy = center if center else (0.5, 0.5)
+    x0 = min(max(0, int(round(cx * w - bw / 2))), w - bw)
+    y0 = min(max(0, int(round(cy * h - bh / 2))), h - bh)
+    return x0, y0, x0 + bw, y0 + bh
+
+
+def _make_zoom_image(src_path: str, zoom: int, center: Optional[Tuple[float, float]] = None):
+    """
+    只生成视口区域的放大图（不再放大整张），返回 (图片路径, 源图坐标下的视口, 源图尺寸)。
+    失败时退回原图，视口为整张图。
+    """
+    zoom = max(1, int(zoom or 1))
     try:
-        with Image.open(src_path) as img:
-            w, h = img.size
-            new_size = (max(1, int(w * zoom)), max(1, int(h * zoom)))
-            zoomed = img.resize(new_size, Image.LANCZOS)
-            zoomed.save(out_path, format="PNG", optimize=True)
-        return out_path
+        src = _zoom_source(src_path)
     except Exception:
-        return src_path
+        try:
+            with Image.open(src_path) as img:
+                size = img.size
+        except Exception:
+            return src_path, None, None
+        return src_path, (0, 0) + size, size
+    box = _zoom_view_box(src.size, zoom, center)
+    if box == (0, 0) + src.size and zoom == 1:
+        return src_path, box, src.size
+    out_path = _editor_zoom_path(src_path, zoom, box)
+    if _reuse_derived(out_path):
+        return out_path, box, src.size
+    try:
+        view = src.crop(box)
+        if zoom > 1:
+            view = view.resize((view.width * zoom, view.height * zoom), Image.LANCZOS)
+        view.save(out_path, format="PNG", compress_level=1)
+        _lease([out_path])
+        return out_path, box, src.size
+    except Exception:
+        return src_path, (0, 0) + src.size, src.size
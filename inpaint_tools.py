@@ -1,20 +1,73 @@
 import os
 import io
+import asyncio
+import threading
 from typing import Tuple, Optional, Any
 
-import httpx
 import gradio as gr
+import httpx
+import numpy as np
 from PIL import Image
 
-from config import MAX_CONCURRENCY, LAMA_SERVER, LAMA_CONNECT_TIMEOUT, LAMA_TIMEOUT, EDITOR_SLOTS
+from config import (
+    EDITOR_SLOTS,
+    EDITOR_CANVAS_SIZE,
+    LAMA_CROP_TO_MASK,
+    LAMA_CROP_MARGIN,
+    LAMA_CROP_MAX_RATIO,
+    LAMA_MASK_THRESHOLD,
+    LAMA_MASK_DILATE,
+    LAMA_MASK_FEATHER,
+    LAMA_CACHE_DIR,
+    LAMA_CACHE_MB,
+    LAMA_PNG_LEVEL,
+    LAMA_PASSTHROUGH_FORMATS,
+    LOCAL_INPAINT_MAX_AREA,
+    LOCAL_INPAINT_FALLBACK,
+    LOCAL_INPAINT_METHOD,
+)
+from cache_utils import DiskLRUCache, _cache_key
+from lama_client import (
+    _LamaUnavailable,
+    _RETRY_STATUS,
+    _encode_multipart,
+    _lama_available,
+    _lama_post,
+    _lama_capacity,
+    _run_coro,
+)
+from local_inpaint import _local_inpaint, _local_inpaint_available
+from mask_utils import (
+    _union_layers,
+    _layer_mask,
+    _resize_mask,
+    _mask_bbox,
+    _expand_box,
+    _mask_dilate,
+    _mask_feather,
+    _mask_to_png,
+    _mask_to_layer,
+    _pack_mask,
+    _unpack_mask,
+)
 from file_utils import (
+    _ImageHandle,
     _normalize_files,
     _file_to_path,
     _to_pil,
     _save_image_bytes,
     _write_preview,
     _zip_bytes,
+    _ZipStream,
+    _imap_ordered,
     _make_zoom_image,
+    _make_editor_image,
+)
+
+_LAMA_CACHE = (
+    DiskLRUCache(LAMA_CACHE_DIR, LAMA_CACHE_MB * 1024 * 1024, suffix=".png")
+    if LAMA_CACHE_MB > 0
+    else None
 )
 
 
@@ -67,58 +120,177 @@ def _lama_form_defaults(image_size: Tuple[int, int]) -> dict:
     }
 
 
-async def _lama_inpaint(image_bytes: bytes, mask_bytes: bytes) -> bytes:
+def _mask_crop_box(mask: np.ndarray, margin: int) -> Optional[Tuple[int, int, int, int]]:
+    bbox = _mask_bbox(mask)
+    if bbox is None:
+        return None
+    h, w = mask.shape
+    box = _expand_box(bbox, margin, (w, h))
+    if (box[2] - box[0]) * (box[3] - box[1]) > LAMA_CROP_MAX_RATIO * w * h:
+        return None
+    return box
+
+
+_TRANSFER_TYPES = {"PNG": ("png", "image/png"), "JPEG": ("jpg", "image/jpeg"), "WEBP": ("webp", "image/webp")}
+
+
+def _png_bytes(img: Image.Image) -> bytes:
+    if img.mode not in ("1", "L", "LA", "P", "RGB", "RGBA"):
+        img = img.convert("RGBA")
+    buf = io.BytesIO()
+    img.save(buf, format="PNG", compress_level=LAMA_PNG_LEVEL)
+    return buf.getvalue()
+
+
+def _transfer_image(image: _ImageHandle) -> Tuple[str, bytes, str]:
+    """上传给 lama 的图片：可接受的格式直接发原文件，其它格式转成低压缩 PNG。"""
+    fmt = image.format
+    if fmt in LAMA_PASSTHROUGH_FORMATS and fmt in _TRANSFER_TYPES:
+        ext, mime = _TRANSFER_TYPES[fmt]
+        return f"image.{ext}", image.data, mime
+    return "image.png", _png_bytes(image.image), "image/png"
+
+
+async def _lama_post_inpaint(image_file: Tuple[str, bytes, str], mask_bytes: bytes, size: Tuple[int, int]) -> bytes:
     files = {
-        "image": ("image.png", image_bytes, "image/png"),
+        "image": image_file,
         "mask": ("mask.png", mask_bytes, "image/png"),
     }
-    img = _to_pil(image_bytes)
-    data = _lama_form_defaults(img.size)
-
-    timeout = httpx.Timeout(LAMA_TIMEOUT, connect=LAMA_CONNECT_TIMEOUT)
-    async with httpx.AsyncClient(timeout=timeout) as client:
-        r = await client.post(f"{LAMA_SERVER}/inpaint", files=files, data=data)
-        if r.status_code != 200:
-            raise RuntimeError(f"/inpaint failed {r.status_code}: {r.text[:800]}")
-        return r.content
+    body, content_type = _encode_multipart(_lama_form_defaults(size), files)
+    r = await _lama_post("/inpaint", content=body, headers={"Content-Type": content_type})
+    if r.status_code in _RETRY_STATUS:
+        raise _LamaUnavailable(f"/inpaint failed {r.status_code}: {r.text[:800]}")
+    if r.status_code != 200:
+        raise RuntimeError(f"/inpaint failed {r.status_code}: {r.text[:800]}")
+    return r.content
+
+
+def _lama_cache_key(image_bytes: bytes, mask: np.ndarray, size: Tuple[int, int]) -> str:
+    form = sorted(_lama_form_defaults(size).items())
+    crop = (LAMA_CROP_TO_MASK, LAMA_CROP_MARGIN, LAMA_CROP_MAX_RATIO, LAMA_MASK_FEATHER)
+    # Passed-through JPEG/WEBP come back in that format, so the policy is part of the result.
+    crop += (sorted(LAMA_PASSTHROUGH_FORMATS),)
+    return _cache_key(image_bytes, mask.shape, np.packbits(mask).tobytes(), form, crop)
+
+
+async def _lama_inpaint(image: _ImageHandle, mask: np.ndarray) -> _ImageHandle:
+    if _LAMA_CACHE is None:
+        return await _lama_inpaint_uncached(image, mask)
+
+    # 相同原图 + 蒙版 + 参数直接用缓存结果，不再请求 lama
+    # image.data / out.data may read the file or encode a PNG: keep both off the loop.
+    key = await asyncio.to_thread(lambda: _lama_cache_key(image.data, mask, image.size))
+    cached = await asyncio.to_thread(_LAMA_CACHE.get, key)
+    if cached is not None:
+        return _ImageHandle.from_bytes(cached)
+    out = await _lama_inpaint_uncached(image, mask)
+    await asyncio.to_thread(lambda: _LAMA_CACHE.put(key, out.data))
+    return out
+
+
+async def _lama_inpaint_uncached(image: _ImageHandle, mask: np.ndarray) -> _ImageHandle:
+    box = None
+    if LAMA_CROP_TO_MASK and (mask.shape[1], mask.shape[0]) == image.size:
+        box = _mask_crop_box(mask, LAMA_CROP_MARGIN)
+    if box is None:
+        image_file, mask_png = await asyncio.to_thread(
+            lambda: (_transfer_image(image), _mask_to_png(mask, LAMA_PNG_LEVEL))
+        )
+        out = await _lama_post_inpaint(image_file, mask_png, image.size)
+        return _ImageHandle.from_bytes(out)
+
+    # 只上传蒙版外接框 + 边距，结果贴回原图
+    x0, y0, x1, y1 = box
+    crop_mask = mask[y0:y1, x0:x1]
+    crop_file, mask_png = await asyncio.to_thread(
+        lambda: (("image.png", _png_bytes(image.image.crop(box)), "image/png"), _mask_to_png(crop_mask, LAMA_PNG_LEVEL))
+    )
+    out = await _lama_post_inpaint(crop_file, mask_png, (x1 - x0, y1 - y0))
+    return await asyncio.to_thread(_paste_patch, image.image, out, crop_mask, box)
+
+
+def _paste_patch(img: Image.Image, out: bytes, crop_mask: np.ndarray, box: Tuple[int, int, int, int]) -> _ImageHandle:
+    crop_size = (box[2] - box[0], box[3] - box[1])
+    patch = _to_pil(out).convert("RGBA")
+    if patch.size != crop_size:
+        patch = patch.resize(crop_size, Image.LANCZOS)
+    base = img.convert("RGBA")
+    if img.mode in ("RGBA", "LA") or ("transparency" in img.info):
+        # lama returns RGB; keep the source alpha inside the patch.
+        patch.putalpha(base.crop(box).getchannel("A"))
+    if LAMA_MASK_FEATHER > 0:
+        base.paste(patch, box[:2], Image.fromarray(_mask_feather(crop_mask, LAMA_MASK_FEATHER)))
+    else:
+        base.paste(patch, box[:2])
+    return _ImageHandle.from_image(base)
+
+
+async def _inpaint(image: _ImageHandle, mask: np.ndarray, logs: Optional[list] = None, base: str = "") -> _ImageHandle:
+    """
+    小蒙版走本地 OpenCV；所有 lama 后端都熔断时回退本地。
+    每次用本地引擎代替 lama 都会在 logs 里记一行。
+    """
+
+    def _local(reason: str):
+        if logs is not None:
+            logs.append(f"[{base}] {reason} -> local {LOCAL_INPAINT_METHOD} inpaint")
+        return asyncio.to_thread(_local_inpaint, image, mask)
+
+    local_ok = _local_inpaint_available() and (mask.shape[1], mask.shape[0]) == image.size
+    if local_ok and LOCAL_INPAINT_MAX_AREA > 0 and int(np.count_nonzero(mask)) <= LOCAL_INPAINT_MAX_AREA:
+        return await _local(f"mask <= {LOCAL_INPAINT_MAX_AREA} px")
+    fallback = local_ok and LOCAL_INPAINT_FALLBACK
+    if fallback and not _lama_available():
+        return await _local("lama circuit open")
+    try:
+        return await _lama_inpaint(image, mask)
+    except (_LamaUnavailable, httpx.TransportError) as e:
+        # One failed request is reported as an error; only a fully open circuit falls back.
+        if not fallback or _lama_available():
+            raise
+        return await _local(f"lama failed ({_format_exc(e)}), circuit open")
 
 
-def _extract_editor_mask(editor_value, target_size: Optional[Tuple[int, int]] = None) -> Optional[bytes]:
+def _editor_raw_mask(editor_value) -> Optional[np.ndarray]:
+    """编辑器所有画笔图层取并集（编辑器分辨率，True=擦除）。"""
     if editor_value is None:
         return None
 
-    img = None
+    mask = None
     if isinstance(editor_value, dict):
         layers = editor_value.get("layers")
-        if layers and isinstance(layers, list) and len(layers) > 0:
-            try:
-                img = _to_pil(layers[0]).convert("L")
-            except Exception:
-                try:
-                    img = _to_pil(layers[0].get("image")).convert("L")
-                except Exception:
-                    img = None
+        if layers and isinstance(layers, list):
+            mask = _union_layers(layers, LAMA_MASK_THRESHOLD)
 
-        if img is None and editor_value.get("mask") is not None:
+        if mask is None and editor_value.get("mask") is not None:
             try:
-                img = _to_pil(editor_value["mask"]).convert("L")
+                mask = _layer_mask(_to_pil(editor_value["mask"]), LAMA_MASK_THRESHOLD)
             except Exception:
-                img = None
+                mask = None
 
-    if img is None:
+    if mask is None:
         try:
-            img = _to_pil(editor_value).convert("L")
+            mask = _layer_mask(_to_pil(editor_value), LAMA_MASK_THRESHOLD)
         except Exception:
             return None
+    return mask
 
-    # 二值化（白=擦除）
-    img = img.point(lambda x: 255 if x > 10 else 0)
-    if target_size and img.size != target_size:
-        img = img.resize(target_size, Image.NEAREST)
 
-    buf = io.BytesIO()
-    img.save(buf, format="PNG")
-    return buf.getvalue()
+def _finish_mask(mask: np.ndarray, target_size: Optional[Tuple[int, int]] = None) -> Optional[np.ndarray]:
+    # Scale to the source image and dilate; None when nothing is painted.
+    if target_size:
+        mask = _resize_mask(mask, target_size)
+    mask = _mask_dilate(mask, LAMA_MASK_DILATE)
+    if not mask.any():
+        return None
+    return mask
+
+
+def _extract_editor_mask(editor_value, target_size: Optional[Tuple[int, int]] = None) -> Optional[np.ndarray]:
+    mask = _editor_raw_mask(editor_value)
+    if mask is None:
+        return None
+    return _finish_mask(mask, target_size)
 
 
 def _editor_file_path(editor_value: Any) -> Optional[str]:
@@ -161,48 +333,245 @@ def _extract_editor_image_bytes(editor_value: Any) -> Optional[bytes]:
         return None
 
 
-def _get_mask_override(mask_overrides: Optional[dict], idx: int) -> Optional[bytes]:
+def _get_mask_override(mask_overrides: Optional[dict], path: str) -> Optional[np.ndarray]:
     if not mask_overrides:
         return None
-    if idx in mask_overrides:
-        return mask_overrides[idx]
-    key = str(idx)
-    if key in mask_overrides:
-        return mask_overrides[key]
+    packed = mask_overrides.get(path)
+    if packed is None:
+        return None
+    return _unpack_mask(packed)
+
+
+def _resolve_mask(
+    path: str,
+    editor_value: Any,
+    page_masks: Optional[dict],
+    mask_overrides: Optional[dict],
+    img_size: Optional[Tuple[int, int]],
+) -> Optional[np.ndarray]:
+    # 放大编辑保存的蒙版优先；当前页用编辑器里的值，其它页用翻页时保存的蒙版
+    mask = _get_mask_override(mask_overrides, path)
+    if mask is not None:
+        return mask
+    if editor_value is not None:
+        return _extract_editor_mask(editor_value, target_size=img_size)
+    packed = (page_masks or {}).get(path)
+    if packed is None:
+        return None
+    return _finish_mask(_unpack_mask(packed), img_size)
+
+
+def _slot_editor_value(editor_values: list, page_start: int, idx: int):
+    slot = idx - page_start
+    return editor_values[slot] if 0 <= slot < len(editor_values) else None
+
+
+def _find_template_mask(
+    paths: list,
+    page_start: int,
+    editor_values: list,
+    page_masks: Optional[dict],
+    mask_overrides: Optional[dict],
+) -> Optional[Tuple[str, np.ndarray]]:
+    # 模板 = 第一张涂过蒙版的图片，按它自己的尺寸取蒙版
+    for idx, path in enumerate(paths):
+        ev = _slot_editor_value(editor_values, page_start, idx)
+        if ev is None and path not in (page_masks or {}) and path not in (mask_overrides or {}):
+            continue
+        try:
+            with Image.open(path) as img:
+                size = img.size
+        except Exception:
+            continue
+        mask = _resolve_mask(path, ev, page_masks, mask_overrides, size)
+        if mask is not None:
+            return path, mask
     return None
 
 
-def _open_zoom_editor(files, zoom, index: int):
+# ---------- Editor pages ----------
+def _page_count(n: int) -> int:
+    return max(1, (n + EDITOR_SLOTS - 1) // EDITOR_SLOTS)
+
+
+def _clamp_page(page: Any, n: int) -> int:
+    try:
+        page = int(page)
+    except (TypeError, ValueError):
+        page = 0
+    return min(max(0, page), _page_count(n) - 1)
+
+
+def _page_info(page: int, n: int) -> str:
+    return f"第 {page+1} / {_page_count(n)} 页（共 {n} 张）"
+
+
+def _editor_slot_value(path: str, page_masks: Optional[dict]):
+    """返回 (预览图, 编辑器值)：两者共用同一张缩小图，原图不再发给浏览器。"""
+    editor_path = _make_editor_image(path, EDITOR_CANVAS_SIZE)
+    packed = (page_masks or {}).get(path)
+    if packed is None:
+        return editor_path, editor_path
+    try:
+        with Image.open(editor_path) as img:
+            size = img.size
+    except Exception:
+        return editor_path, editor_path
+    layer = _mask_to_layer(_unpack_mask(packed), size)
+    return editor_path, {"background": editor_path, "layers": [layer], "composite": editor_path}
+
+
+def _load_editor_page(files, page, page_masks: Optional[dict]):
+    """只为当前页生成编辑器图片（各张并行），并把之前涂过的蒙版还原到图层。"""
     paths = _normalize_files(files)
+    page = _clamp_page(page, len(paths))
+    start = page * EDITOR_SLOTS
+    page_paths = paths[start:start + EDITOR_SLOTS]
+    values = list(_imap_ordered(lambda p: _editor_slot_value(p, page_masks), page_paths))
+    previews = []
+    editors = []
+    for i in range(EDITOR_SLOTS):
+        k = start + i
+        preview, editor = values[i] if i < len(values) else (None, None)
+        previews.append(gr.update(value=preview, label=f"第 {k+1} 张预览"))
+        editors.append(gr.update(value=editor, label=f"第 {k+1} 张：涂抹要移除区域（白色）"))
+    return [page, _page_info(page, len(paths))] + previews + editors
+
+
+def _save_page_masks(paths: list, page: int, page_masks: Optional[dict], editor_values) -> dict:
+    new_masks = dict(page_masks or {})
+    start = page * EDITOR_SLOTS
+    for i, ev in enumerate(editor_values):
+        if start + i >= len(paths):
+            break
+        path = paths[start + i]
+        mask = _editor_raw_mask(ev) if ev is not None else None
+        if mask is not None and mask.any():
+            new_masks[path] = _pack_mask(mask)
+        else:
+            new_masks.pop(path, None)
+    return new_masks
+
+
+def _change_editor_page(files, page, page_masks: Optional[dict], *editor_values, delta: int = 0):
+    paths = _normalize_files(files)
+    page = _clamp_page(page, len(paths))
+    new_masks = _save_page_masks(paths, page, page_masks, editor_values)
+    return [new_masks] + _load_editor_page(files, page + delta, new_masks)
+
+
+def _reset_editor_pages():
+    return 0, {}, {}
+
+
+def _zoom_seed_mask(path: str, editor_value, mask_overrides: Optional[dict], size) -> Optional[np.ndarray]:
+    # 已保存的放大蒙版优先，否则用小编辑器里已涂的，放大编辑在它的基础上修改
+    mask = _get_mask_override(mask_overrides, path)
+    if mask is not None:
+        return _resize_mask(mask, size)
+    if editor_value is not None:
+        return _extract_editor_mask(editor_value, target_size=size)
+    return None
+
+
+def _zoom_editor_value(view_path: str, box, base: Optional[np.ndarray]):
+    if base is None or box is None:
+        return view_path
+    x0, y0, x1, y1 = box
+    crop = base[y0:y1, x0:x1]
+    if not crop.any():
+        return view_path
+    try:
+        with Image.open(view_path) as img:
+            view_size = img.size
+    except Exception:
+        return view_path
+    layer = _mask_to_layer(crop, view_size)
+    return {"background": view_path, "layers": [layer], "composite": view_path}
+
+
+def _zoom_title(state: dict) -> str:
+    x0, y0, x1, y1 = state["box"]
+    return f"### 放大编辑第 {state['index']+1} 张（{state['zoom']}x，区域 {x0},{y0} – {x1},{y1}）"
+
+
+def _zoom_view(state: dict, base: Optional[np.ndarray], center):
+    view_path, box, size = _make_zoom_image(state["path"], state["zoom"], center)
+    state = dict(state, box=list(box) if box else None, size=list(size) if size else None)
+    state["base"] = _pack_mask(base) if base is not None and base.any() else None
+    return view_path, state
+
+
+def _merge_zoom_strokes(zoom_editor_value, zoom_state: dict) -> Optional[np.ndarray]:
+    """把视口里的笔画按偏移写回整张图尺寸的蒙版，视口外保持原样。"""
+    w, h = zoom_state["size"]
+    base = _unpack_mask(zoom_state["base"]) if zoom_state.get("base") else np.zeros((h, w), dtype=bool)
+    # A bare image (no layers) is the view itself, not strokes.
+    raw = _editor_raw_mask(zoom_editor_value) if isinstance(zoom_editor_value, dict) else None
+    if raw is None:
+        return base
+    x0, y0, x1, y1 = zoom_state["box"]
+    painted = _resize_mask(raw, (x1 - x0, y1 - y0))
+    shown = base[y0:y1, x0:x1]
+    # The seeded mask was already dilated; only dilate strokes added in this view,
+    # so panning and saving again does not grow it.
+    strokes = np.zeros_like(base)
+    strokes[y0:y1, x0:x1] = painted & ~shown
+    base[y0:y1, x0:x1] = painted & shown
+    return base | _mask_dilate(strokes, LAMA_MASK_DILATE)
+
+
+def _open_zoom_editor(files, zoom, page, editor_value, mask_overrides: Optional[dict], index: int):
+    paths = _normalize_files(files)
+    index = _clamp_page(page, len(paths)) * EDITOR_SLOTS + index
     if index >= len(paths):
-        return gr.update(visible=False), "### 放大编辑", None, {}, "未找到对应图片"
+        return gr.update(visible=False), "### 放大编辑", None, {}, gr.update(), gr.update(), "未找到对应图片"
     path = paths[index]
-    zoom = int(zoom) if zoom else 1
-    zoom_path = _make_zoom_image(path, zoom)
-    size = None
     try:
         with Image.open(path) as img:
-            size = [img.size[0], img.size[1]]
-    except Exception:
-        size = None
-    state = {"index": int(index), "path": path, "zoom": int(zoom), "size": size}
-    title = f"### 放大编辑第 {index+1} 张（{zoom}x）"
-    return gr.update(visible=True), title, zoom_path, state, f"进入放大编辑：第 {index+1} 张"
+            size = img.size
+    except Exception as e:
+        return gr.update(visible=False), "### 放大编辑", None, {}, gr.update(), gr.update(), f"打开图片失败: {e}"
+
+    base = _zoom_seed_mask(path, editor_value, mask_overrides, size)
+    # 视口默认对准已涂抹的区域，没有蒙版时对准图片中心
+    center = (0.5, 0.5)
+    bbox = _mask_bbox(base) if base is not None else None
+    if bbox is not None:
+        center = ((bbox[0] + bbox[2]) / 2 / size[0], (bbox[1] + bbox[3]) / 2 / size[1])
+    state = {"index": int(index), "path": path, "zoom": int(zoom) if zoom else 1}
+    view_path, state = _zoom_view(state, base, center)
+    if state["box"] is None:
+        return gr.update(visible=False), "### 放大编辑", None, {}, gr.update(), gr.update(), "打开图片失败"
+    return (
+        gr.update(visible=True),
+        _zoom_title(state),
+        _zoom_editor_value(view_path, state["box"], base),
+        state,
+        round(center[0] * 100),
+        round(center[1] * 100),
+        f"进入放大编辑：第 {index+1} 张",
+    )
+
+
+def _pan_zoom_editor(zoom_editor_value, zoom_state: dict, pos_x, pos_y):
+    # 移动视口前先把当前视口的笔画并入整图蒙版，避免丢失
+    if not zoom_state or not zoom_state.get("box"):
+        return gr.update(), zoom_state, gr.update(), "未选择要放大的图片"
+    base = _merge_zoom_strokes(zoom_editor_value, zoom_state)
+    view_path, state = _zoom_view(zoom_state, base, (float(pos_x) / 100, float(pos_y) / 100))
+    return _zoom_editor_value(view_path, state["box"], base), state, _zoom_title(state), "已移动放大区域"
 
 
 def _save_zoom_mask(zoom_editor_value, zoom_state: dict, mask_overrides: Optional[dict]):
-    if not zoom_state or zoom_state.get("index") is None:
+    if not zoom_state or zoom_state.get("index") is None or not zoom_state.get("box"):
         return mask_overrides or {}, gr.update(visible=False), "未选择要放大的图片"
     idx = int(zoom_state.get("index", 0))
-    size = zoom_state.get("size")
-    target_size = None
-    if size and len(size) == 2:
-        target_size = (int(size[0]), int(size[1]))
-    mask_bytes = _extract_editor_mask(zoom_editor_value, target_size=target_size)
-    if mask_bytes is None:
+    mask = _merge_zoom_strokes(zoom_editor_value, zoom_state)
+    if mask is None or not mask.any():
         return mask_overrides or {}, gr.update(visible=True), "没有检测到蒙版"
     new_overrides = dict(mask_overrides or {})
-    new_overrides[idx] = mask_bytes
+    new_overrides[zoom_state["path"]] = _pack_mask(mask)
     return new_overrides, gr.update(visible=False), f"已保存第 {idx+1} 张放大蒙版"
 
 
@@ -210,10 +579,6 @@ def _close_zoom_editor():
     return gr.update(visible=False)
 
 
-def _reset_mask_overrides():
-    return {}
-
-
 def _format_exc(e: Exception) -> str:
     try:
         msg = str(e).strip()
@@ -224,134 +589,165 @@ def _format_exc(e: Exception) -> str:
     return f"{type(e).__name__}: {repr(e)}"
 
 
-def batch_inpaint_ui(input_files: Any, *args):
+def _export_inpaint(out: _ImageHandle, out_format: str, quality: int, preset: Optional[str] = None) -> bytes:
+    return _save_image_bytes(out.image.convert("RGBA"), out_format, quality=quality, preset=preset)
+
+
+def batch_inpaint_ui(input_files: Any, page: Any, page_masks: Optional[dict], *args):
     input_paths = _normalize_files(input_files)
     if not input_paths:
         return [], None, "No input files."
 
+    # Editors only hold the visible page; other pages come from page_masks.
+    page_start = _clamp_page(page, len(input_paths)) * EDITOR_SLOTS
     editor_values = list(args[:EDITOR_SLOTS])
     out_format = args[EDITOR_SLOTS]
     quality = int(args[EDITOR_SLOTS + 1])
     mask_overrides = args[EDITOR_SLOTS + 2] if len(args) > (EDITOR_SLOTS + 2) else None
+    use_template = bool(args[EDITOR_SLOTS + 3]) if len(args) > (EDITOR_SLOTS + 3) else False
+    preset = args[EDITOR_SLOTS + 4] if len(args) > (EDITOR_SLOTS + 4) else None
 
     outputs_gallery = []
-    outputs_zip_items = []
+    zip_out = _ZipStream()
     logs = []
 
-    import asyncio
-
-    async def _run_one(idx: int, path: str, sem: asyncio.Semaphore):
+    template = None
+    template_scaled = {}
+    if use_template:
+        found = _find_template_mask(input_paths, page_start, editor_values, page_masks, mask_overrides)
+        if found is None:
+            return [], None, "模板模式：没有找到涂过蒙版的图片"
+        template_path, template = found
+        logs.append(f"模板蒙版：{os.path.basename(template_path)}")
+
+    template_lock = threading.Lock()
+
+    def _template_for(size: Tuple[int, int]) -> np.ndarray:
+        # Same-size shots share one scaled copy; workers call this from to_thread.
+        with template_lock:
+            mask = template_scaled.get(size)
+            if mask is None:
+                mask = template_scaled[size] = _resize_mask(template, size)
+            return mask
+
+    async def _run_one(idx: int, path: str):
         base = os.path.splitext(os.path.basename(path))[0]
 
+        image = _ImageHandle.from_path(path)
         try:
-            img_bytes = open(path, "rb").read()
-            img_size = _to_pil(img_bytes).size
+            # Header only; pixels are decoded later only if the crop path needs them.
+            img_size = await asyncio.to_thread(lambda: image.size)
         except Exception as e:
             logs.append(f"[{base}] read failed: {e}")
             return
 
-        mask_bytes = _get_mask_override(mask_overrides, idx)
-        if mask_bytes is None:
-            mask_bytes = _extract_editor_mask(editor_values[idx], target_size=img_size)
-        if mask_bytes is None:
+        if template is not None:
+            mask = await asyncio.to_thread(_template_for, img_size)
+        else:
+            editor_value = _slot_editor_value(editor_values, page_start, idx)
+            mask = await asyncio.to_thread(_resolve_mask, path, editor_value, page_masks, mask_overrides, img_size)
+        if mask is None:
             logs.append(f"[{base}] No mask -> skip")
             return
 
-        async with sem:
-            try:
-                out_png = await _lama_inpaint(img_bytes, mask_bytes)
-            except Exception as e:
-                logs.append(f"[{base}] inpaint failed: {_format_exc(e)}")
-                return
+        try:
+            out = await _inpaint(image, mask, logs, base)
+        except Exception as e:
+            logs.append(f"[{base}] inpaint failed: {_format_exc(e)}")
+            return
 
         try:
-            pil = _to_pil(out_png).convert("RGBA")
-            out_bytes = _save_image_bytes(pil, out_format, quality=quality)
+            # Encoding is CPU-bound; keep it off the shared lama event loop.
+            out_bytes = await asyncio.to_thread(_export_inpaint, out, out_format, quality, preset)
         except Exception as e:
             logs.append(f"[{base}] export failed: {e}")
             return
 
         ext = out_format.lower().replace("jpeg", "jpg")
         name = f"{base}_clean.{ext}"
-        outputs_zip_items.append((name, out_bytes))
-        outputs_gallery.append(_write_preview(name, out_bytes))
+        # Disk I/O; keep it off the lama event loop.
+        await asyncio.to_thread(zip_out.add, name, out_bytes)
+        outputs_gallery.append(await asyncio.to_thread(_write_preview, name, out_bytes, out.image))
 
     async def _run_all():
-        sem = asyncio.Semaphore(MAX_CONCURRENCY)
-        max_n = min(len(input_paths), len(editor_values))
-        tasks = [asyncio.create_task(_run_one(i, input_paths[i], sem)) for i in range(max_n)]
-        await asyncio.gather(*tasks)
+        # A fixed set of workers pulls the next file when it finishes one, so only
+        # that many files, masks and results are in memory however large the batch.
+        # Per-backend limits are enforced in lama_client.
+        todo = iter(enumerate(input_paths))
 
-    asyncio.run(_run_all())
+        async def _worker():
+            for idx, path in todo:
+                await _run_one(idx, path)
 
-    zip_path = _zip_bytes(outputs_zip_items)
+        n = max(1, min(_lama_capacity(), len(input_paths)))
+        await asyncio.gather(*(_worker() for _ in range(n)))
+
+    _run_coro(_run_all())
+
+    zip_path = zip_out.close()
     return outputs_gallery, zip_path, ("\n".join(logs) if logs else "OK")
 
 
 def inpaint_single_ui(
     file_list: Any,
+    page: Any,
     editor_value: Any,
     out_format: str,
     quality: int,
     mask_overrides: Optional[dict],
+    preset: Optional[str] = None,
     index: int = 0,
 ):
     def _no_change(msg: str):
         return gr.update(), gr.update(), gr.update(), msg
 
-    file_path = None
-    if file_list and isinstance(file_list, list) and index < len(file_list):
-        file_path = _file_to_path(file_list[index])
-    elif file_list and not isinstance(file_list, list):
-        file_path = _file_to_path(file_list)
+    paths = _normalize_files(file_list)
+    index = _clamp_page(page, len(paths)) * EDITOR_SLOTS + index
+    file_path = paths[index] if index < len(paths) else None
 
     if not file_path:
         file_path = _editor_file_path(editor_value)
 
-    img_bytes = None
+    image = None
     img_size = None
     base = None
     if file_path and os.path.exists(file_path):
         base = os.path.splitext(os.path.basename(file_path))[0]
         try:
-            img_bytes = open(file_path, "rb").read()
+            image = _ImageHandle.from_path(file_path).load()
         except Exception as e:
             return _no_change(f"[{base}] read failed: {e}")
     else:
         img_bytes = _extract_editor_image_bytes(editor_value)
         if not img_bytes:
             return _no_change("No input file.")
+        image = _ImageHandle.from_bytes(img_bytes)
         base = f"editor_{index+1}"
 
     try:
-        img_size = _to_pil(img_bytes).size
+        img_size = image.size
     except Exception:
         img_size = None
 
-    mask_bytes = _get_mask_override(mask_overrides, index)
-    if mask_bytes is None:
-        mask_bytes = _extract_editor_mask(editor_value, target_size=img_size)
-    if mask_bytes is None:
+    mask = _get_mask_override(mask_overrides, file_path) if file_path else None
+    if mask is None:
+        mask = _extract_editor_mask(editor_value, target_size=img_size)
+    if mask is None:
         return _no_change(f"[{base}] No mask -> skip")
 
-    import asyncio
-
-    async def _run():
-        return await _lama_inpaint(img_bytes, mask_bytes)
-
+    logs = []
     try:
-        out_png = asyncio.run(_run())
+        out = _run_coro(_inpaint(image, mask, logs, base))
     except Exception as e:
         return _no_change(f"[{base}] inpaint failed: {_format_exc(e)}")
 
     try:
-        pil = _to_pil(out_png).convert("RGBA")
-        out_bytes = _save_image_bytes(pil, out_format, quality=int(quality))
+        out_bytes = _export_inpaint(out, out_format, int(quality), preset)
     except Exception as e:
         return _no_change(f"[{base}] export failed: {e}")
 
     ext = out_format.lower().replace("jpeg", "jpg")
     name = f"{base}_clean.{ext}"
-    out_path = _write_preview(name, out_bytes)
+    out_path = _write_preview(name, out_bytes, out.image)
     zip_path = _zip_bytes([(name, out_bytes)])
-    return out_path, [out_path], zip_path, "OK"
+    return out_path, [out_path], zip_path, ("\n".join(logs) if logs else "OK")
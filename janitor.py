@@ -0,0 +1,145 @@
+import os
+import logging
+import threading
+import time
+from typing import Dict, Iterable, Optional
+
+from config import (
+    OUT_DIR,
+    OUT_DIR_TTL_HOURS,
+    OUT_DIR_MAX_MB,
+    OUT_DIR_LEASE_SECONDS,
+    OUT_DIR_JANITOR_INTERVAL,
+)
+
+logger = logging.getLogger(__name__)
+
+# path -> time until which a session may still use the file.
+_LEASES: Dict[str, float] = {}
+_LEASE_LOCK = threading.Lock()
+_STATS = {
+    "runs": 0,
+    "deleted_files": 0,
+    "reclaimed_bytes": 0,
+    "last_run": None,
+    "last_deleted_files": 0,
+    "last_reclaimed_bytes": 0,
+    "files": 0,
+    "bytes": 0,
+}
+_JANITOR_THREAD: Optional[threading.Thread] = None
+
+
+def _lease(paths: Iterable[str], seconds: Optional[float] = None):
+    """标记文件仍被界面使用：租约期内清理线程不会删除它，重复调用会续期。"""
+    until = time.time() + (OUT_DIR_LEASE_SECONDS if seconds is None else seconds)
+    with _LEASE_LOCK:
+        for p in paths:
+            if p:
+                p = os.path.abspath(p)
+                _LEASES[p] = max(until, _LEASES.get(p, 0.0))
+
+
+def _leased(now: float) -> set:
+    with _LEASE_LOCK:
+        for p in [p for p, until in _LEASES.items() if until <= now]:
+            del _LEASES[p]
+        return set(_LEASES)
+
+
+def _sweep_out_dir(now: Optional[float] = None) -> dict:
+    """
+    只清理 OUT_DIR 顶层文件（子目录是各自带 LRU 的缓存）：先删超过 TTL 的，
+    总大小仍超配额时按最近使用时间从旧到新删；有租约的文件一律跳过。
+    """
+    now = time.time() if now is None else now
+    leased = _leased(now)
+    ttl = OUT_DIR_TTL_HOURS * 3600
+    max_bytes = OUT_DIR_MAX_MB * 1024 * 1024
+
+    entries = []
+    try:
+        with os.scandir(OUT_DIR) as it:
+            for e in it:
+                if not e.is_file(follow_symlinks=False):
+                    continue
+                try:
+                    st = e.stat()
+                except OSError:
+                    continue
+                entries.append((max(st.st_mtime, st.st_atime), st.st_size, e.path))
+    except OSError:
+        return dict(_STATS)
+
+    total = sum(size for _, size, _ in entries)
+    deleted = 0
+    reclaimed = 0
+
+    def _delete(size: int, path: str) -> bool:
+        nonlocal total, deleted, reclaimed
+        try:
+            os.remove(path)
+        except OSError:
+            return False
+        total -= size
+        deleted += 1
+        reclaimed += size
+        return True
+
+    keep = []
+    for used, size, path in sorted(entries):
+        if path in leased:
+            continue
+        if ttl > 0 and now - used > ttl:
+            _delete(size, path)
+        else:
+            keep.append((used, size, path))
+
+    if max_bytes > 0 and total > max_bytes:
+        target = int(max_bytes * 0.9)
+        for used, size, path in keep:
+            if total <= target:
+                break
+            _delete(size, path)
+
+    _STATS["runs"] += 1
+    _STATS["deleted_files"] += deleted
+    _STATS["reclaimed_bytes"] += reclaimed
+    _STATS["last_run"] = now
+    _STATS["last_deleted_files"] = deleted
+    _STATS["last_reclaimed_bytes"] = reclaimed
+    _STATS["files"] = len(entries) - deleted
+    _STATS["bytes"] = total
+    if deleted:
+        logger.info(
+            "removed %d files, %.1f MB; %d files / %.1f MB left, %.1f MB reclaimed since start",
+            deleted,
+            reclaimed / 1024 / 1024,
+            _STATS["files"],
+            total / 1024 / 1024,
+            _STATS["reclaimed_bytes"] / 1024 / 1024,
+        )
+    return dict(_STATS)
+
+
+def _janitor_stats() -> dict:
+    return dict(_STATS)
+
+
+def _janitor_loop():
+    while True:
+        try:
+            _sweep_out_dir()
+        except Exception as e:
+            logger.warning("sweep of %s failed: %s", OUT_DIR, e)
+        time.sleep(OUT_DIR_JANITOR_INTERVAL)
+
+
+def _start_janitor() -> Optional[threading.Thread]:
+    global _JANITOR_THREAD
+    if OUT_DIR_JANITOR_INTERVAL <= 0 or (OUT_DIR_TTL_HOURS <= 0 and OUT_DIR_MAX_MB <= 0):
+        return None
+    if _JANITOR_THREAD is None or not _JANITOR_THREAD.is_alive():
+        _JANITOR_THREAD = threading.Thread(target=_janitor_loop, name="out-janitor", daemon=True)
+        _JANITOR_THREAD.start()
+    return _JANITOR_THREAD
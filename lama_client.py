@@ -0,0 +1,289 @@
+import asyncio
+import random
+import threading
+import time
+from typing import Any, Coroutine, List, Optional, Set, Tuple
+
+import httpx
+
+from config import (
+    LAMA_SERVERS,
+    LAMA_HEALTH_INTERVAL,
+    LAMA_RETRIES,
+    LAMA_RETRY_BACKOFF,
+    LAMA_BREAKER_FAILURES,
+    LAMA_BREAKER_COOLDOWN,
+    LAMA_AIMD_SLOW_FACTOR,
+    LAMA_CONNECT_TIMEOUT,
+    LAMA_TIMEOUT,
+    LAMA_MAX_CONNECTIONS,
+    LAMA_KEEPALIVE_EXPIRY,
+    LAMA_HTTP2,
+)
+
+# ---------- Background event loop ----------
+# Gradio handlers run in worker threads; instead of asyncio.run() per click
+# they submit coroutines to one long-lived loop that owns the HTTP client.
+_LOOP: Optional[asyncio.AbstractEventLoop] = None
+_LOOP_LOCK = threading.Lock()
+_CLIENT: Optional[httpx.AsyncClient] = None
+_HEALTH_TASK: Optional[asyncio.Task] = None
+# Status codes that mean "this backend cannot take the request right now".
+_RETRY_STATUS = {429, 502, 503, 504}
+# The request never reached the server, so resending it cannot duplicate work.
+# Read/write timeouts are not retried: the server may still be busy with it.
+_RETRY_EXC = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+class _LamaUnavailable(RuntimeError):
+    pass
+
+
+class _AimdLimiter:
+    """
+    在途请求上限：成功且延迟正常时加性增长（每轮 +1），
+    出错或延迟超过均值 LAMA_AIMD_SLOW_FACTOR 倍时减半。
+    """
+
+    def __init__(self, max_limit: int):
+        self.max_limit = max_limit
+        self.limit = float(max_limit)
+        self.in_flight = 0
+        self.ewma: Optional[float] = None
+        self._last_cut = 0.0
+        self._cond: Optional[asyncio.Condition] = None
+
+    @property
+    def cond(self) -> asyncio.Condition:
+        # Created lazily so it binds to the background loop.
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        return self._cond
+
+    async def acquire(self):
+        async with self.cond:
+            while self.in_flight >= max(1, int(self.limit)):
+                await self.cond.wait()
+            self.in_flight += 1
+
+    async def release(self, latency: float, ok: bool):
+        self.in_flight -= 1
+        if ok:
+            slow = self.ewma is not None and latency > LAMA_AIMD_SLOW_FACTOR * self.ewma
+            self.ewma = latency if self.ewma is None else 0.8 * self.ewma + 0.2 * latency
+            if slow:
+                self._cut()
+            else:
+                self.limit = min(float(self.max_limit), self.limit + 1.0 / self.limit)
+        else:
+            self._cut()
+        async with self.cond:
+            self.cond.notify_all()
+
+    def _cut(self):
+        # At most one cut per round trip, so a burst of timeouts halves once.
+        now = time.monotonic()
+        if now - self._last_cut < (self.ewma or 1.0):
+            return
+        self._last_cut = now
+        self.limit = max(1.0, self.limit / 2)
+
+
+class _LamaBackend:
+    """一个 lama-cleaner 实例：并发限流、在途请求数、健康状态与熔断器（仅在事件循环线程里修改）。"""
+
+    def __init__(self, url: str, limit: int):
+        self.url = url
+        self.limit = limit
+        self.limiter = _AimdLimiter(limit)
+        self.outstanding = 0
+        self.healthy = True
+        self.last_error = ""
+        self.checked_at = 0.0
+        self.failures = 0
+        self.open_until = 0.0
+        self.trial_in_flight = False
+
+    def mark_down(self, err: str):
+        self.healthy = False
+        self.last_error = err
+        self.checked_at = time.monotonic()
+
+    def breaker_allows(self) -> bool:
+        if self.failures < LAMA_BREAKER_FAILURES:
+            return True
+        # Open; after the cooldown let a single trial request through (half-open).
+        return time.monotonic() >= self.open_until and not self.trial_in_flight
+
+    def record(self, ok: bool, err: str = ""):
+        if ok:
+            self.failures = 0
+            self.healthy = True
+            return
+        self.failures += 1
+        self.mark_down(err)
+        if self.failures >= LAMA_BREAKER_FAILURES:
+            self.open_until = time.monotonic() + LAMA_BREAKER_COOLDOWN
+
+    async def post(self, path: str, **kwargs) -> httpx.Response:
+        trial = self.failures >= LAMA_BREAKER_FAILURES
+        if trial:
+            self.trial_in_flight = True
+        self.outstanding += 1
+        start = None
+        ok = False
+        try:
+            await self.limiter.acquire()
+            start = time.monotonic()
+            r = await _get_client().post(f"{self.url}{path}", **kwargs)
+            ok = r.status_code not in _RETRY_STATUS
+            self.record(ok, "" if ok else f"HTTP {r.status_code}")
+            return r
+        except httpx.TransportError as e:
+            self.record(False, f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            self.outstanding -= 1
+            if trial:
+                self.trial_in_flight = False
+            if start is not None:
+                await self.limiter.release(time.monotonic() - start, ok)
+
+
+_BACKENDS: List[_LamaBackend] = [_LamaBackend(url, limit) for url, limit in LAMA_SERVERS]
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    global _LOOP
+    with _LOOP_LOCK:
+        if _LOOP is None or _LOOP.is_closed():
+            loop = asyncio.new_event_loop()
+            t = threading.Thread(target=loop.run_forever, name="lama-loop", daemon=True)
+            t.start()
+            _LOOP = loop
+        return _LOOP
+
+
+def _run_coro(coro: Coroutine[Any, Any, Any], timeout: Optional[float] = None) -> Any:
+    fut = asyncio.run_coroutine_threadsafe(coro, _get_loop())
+    return fut.result(timeout)
+
+
+def _h2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _get_client() -> httpx.AsyncClient:
+    # Only touched from the loop thread, so no lock is needed.
+    global _CLIENT
+    if _CLIENT is None or _CLIENT.is_closed:
+        _CLIENT = httpx.AsyncClient(
+            # pool=None: waiting for a free connection is not a lama timeout.
+            timeout=httpx.Timeout(LAMA_TIMEOUT, connect=LAMA_CONNECT_TIMEOUT, pool=None),
+            limits=httpx.Limits(
+                max_connections=LAMA_MAX_CONNECTIONS,
+                max_keepalive_connections=LAMA_MAX_CONNECTIONS,
+                keepalive_expiry=LAMA_KEEPALIVE_EXPIRY,
+            ),
+            http2=LAMA_HTTP2 and _h2_available(),
+        )
+    return _CLIENT
+
+
+def _encode_multipart(data: dict, files: dict) -> Tuple[bytes, str]:
+    # Build the multipart body once; failover and retries resend the same bytes.
+    req = httpx.Request("POST", "http://lama/", data=data, files=files)
+    return req.read(), req.headers["Content-Type"]
+
+
+# ---------- Backends ----------
+def _lama_capacity() -> int:
+    return sum(b.limit for b in _BACKENDS)
+
+
+def _lama_available() -> bool:
+    # Only an open circuit on every backend counts as down; a single failed
+    # request (healthy=False until the next probe) does not.
+    return any(b.breaker_allows() for b in _BACKENDS)
+
+
+def _pick_backend(exclude: Set[int]) -> Optional[_LamaBackend]:
+    candidates = [b for b in _BACKENDS if id(b) not in exclude and b.breaker_allows()]
+    healthy = [b for b in candidates if b.healthy]
+    # All down: still try one, it may have come back since the last check.
+    pool = healthy or candidates
+    if not pool:
+        return None
+    return min(pool, key=lambda b: b.outstanding / b.limiter.limit)
+
+
+def _backoff_delay(attempt: int) -> float:
+    # Full jitter: spreads retries of a whole batch instead of syncing them.
+    return random.uniform(0, LAMA_RETRY_BACKOFF * (2 ** attempt))
+
+
+async def _check_backend(backend: _LamaBackend):
+    try:
+        r = await _get_client().get(f"{backend.url}/", timeout=httpx.Timeout(5.0, connect=LAMA_CONNECT_TIMEOUT))
+        if r.status_code >= 500:
+            backend.mark_down(f"HTTP {r.status_code}")
+            return
+        backend.healthy = True
+        backend.last_error = ""
+        backend.checked_at = time.monotonic()
+    except httpx.HTTPError as e:
+        backend.mark_down(f"{type(e).__name__}: {e}")
+
+
+async def _health_loop():
+    while True:
+        await asyncio.gather(*[_check_backend(b) for b in _BACKENDS])
+        await asyncio.sleep(LAMA_HEALTH_INTERVAL)
+
+
+def _ensure_health_task():
+    global _HEALTH_TASK
+    if LAMA_HEALTH_INTERVAL <= 0:
+        return
+    if _HEALTH_TASK is None or _HEALTH_TASK.done():
+        _HEALTH_TASK = asyncio.get_running_loop().create_task(_health_loop())
+
+
+async def _lama_post(path: str, **kwargs) -> httpx.Response:
+    """
+    发给在途请求最少的可用后端；连接失败/429/5xx 网关错误时先换后端，
+    所有后端都失败后按抖动退避重试 LAMA_RETRIES 轮；全部熔断时直接失败。
+    读超时等请求已送达的错误直接抛出，不重发，避免在忙碌的后端上重复计算。
+    """
+    _ensure_health_task()
+    tried: Set[int] = set()
+    attempt = 0
+    last_exc: Optional[Exception] = None
+    last_resp: Optional[httpx.Response] = None
+    while True:
+        backend = _pick_backend(tried)
+        if backend is None:
+            if last_exc is None and last_resp is None:
+                raise _LamaUnavailable("lama backend unavailable (circuit open)")
+            if attempt >= LAMA_RETRIES:
+                if last_resp is not None:
+                    return last_resp
+                raise last_exc
+            await asyncio.sleep(_backoff_delay(attempt))
+            attempt += 1
+            tried.clear()
+            continue
+        tried.add(id(backend))
+        try:
+            r = await backend.post(path, **kwargs)
+        except _RETRY_EXC as e:
+            last_exc, last_resp = e, None
+            continue
+        if r.status_code in _RETRY_STATUS:
+            last_exc, last_resp = None, r
+            continue
+        return r
@@ -0,0 +1,48 @@
+from typing import Optional
+
+import numpy as np
+from PIL import Image
+
+from config import LOCAL_INPAINT_METHOD, LOCAL_INPAINT_RADIUS
+from file_utils import _ImageHandle
+from mask_utils import _mask_bbox, _expand_box
+
+try:
+    import cv2
+except ImportError:  # opencv-python-headless is optional
+    cv2 = None
+
+
+def _local_inpaint_available() -> bool:
+    return cv2 is not None
+
+
+def _cv2_flag(method: Optional[str] = None) -> int:
+    method = (method or LOCAL_INPAINT_METHOD).lower()
+    return cv2.INPAINT_NS if method == "ns" else cv2.INPAINT_TELEA
+
+
+def _local_inpaint(image: _ImageHandle, mask: np.ndarray) -> _ImageHandle:
+    """
+    OpenCV Telea/NS 本地修复：只处理蒙版外接框附近的区域，透明通道保持不变。
+    与 _lama_inpaint 同样输入输出，供小蒙版和 lama 不可用时使用。
+    """
+    if cv2 is None:
+        raise RuntimeError("local inpaint needs opencv (pip install opencv-python-headless)")
+    img = image.image
+    if (mask.shape[1], mask.shape[0]) != img.size:
+        raise ValueError(f"mask {mask.shape[1]}x{mask.shape[0]} != image {img.size[0]}x{img.size[1]}")
+    bbox = _mask_bbox(mask)
+    if bbox is None:
+        return image
+
+    # Telea/NS only look ~radius px around the hole; a few radii of context is enough.
+    box = _expand_box(bbox, 4 * LOCAL_INPAINT_RADIUS + 4, img.size)
+    x0, y0, x1, y1 = box
+    base = img.convert("RGBA")
+    crop = np.asarray(base.crop(box))
+    hole = mask[y0:y1, x0:x1].astype(np.uint8) * 255
+    rgb = cv2.inpaint(np.ascontiguousarray(crop[..., :3]), hole, LOCAL_INPAINT_RADIUS, _cv2_flag())
+    patch = np.dstack([rgb, crop[..., 3]])
+    base.paste(Image.fromarray(patch, "RGBA"), box[:2])
+    return _ImageHandle.from_image(base)
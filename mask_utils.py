@@ -0,0 +1,140 @@
+import io
+import zlib
+from typing import Any, Iterable, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from file_utils import _to_pil
+
+# Masks are HxW bool arrays (True = erase) from extraction until they are sent.
+Box = Tuple[int, int, int, int]
+
+
+def _layer_mask(img: Image.Image, threshold: int) -> np.ndarray:
+    # Brush layers are transparent except where painted: threshold alpha.
+    # Opaque images (legacy "mask" values) fall back to luminance.
+    if img.mode in ("RGBA", "LA", "PA") or "transparency" in img.info:
+        rgba = img if img.mode == "RGBA" else img.convert("RGBA")
+        alpha = np.asarray(rgba.getchannel("A"))
+        if alpha.min() < 255:
+            return alpha > threshold
+    return np.asarray(img.convert("L")) > threshold
+
+
+def _resize_mask(mask: np.ndarray, size: Tuple[int, int]) -> np.ndarray:
+    if (mask.shape[1], mask.shape[0]) == tuple(size):
+        return mask
+    return np.asarray(Image.fromarray(mask).resize(size, Image.NEAREST))
+
+
+def _union_layers(layers: Iterable[Any], threshold: int) -> Optional[np.ndarray]:
+    out = None
+    for layer in layers:
+        try:
+            img = _to_pil(layer)
+        except Exception:
+            try:
+                img = _to_pil(layer.get("image"))
+            except Exception:
+                continue
+        m = _layer_mask(img, threshold)
+        if out is None:
+            out = m.copy()
+        else:
+            out |= _resize_mask(m, (out.shape[1], out.shape[0]))
+    return out
+
+
+def _mask_bbox(mask: np.ndarray) -> Optional[Box]:
+    rows = np.flatnonzero(mask.any(axis=1))
+    if rows.size == 0:
+        return None
+    cols = np.flatnonzero(mask.any(axis=0))
+    return int(cols[0]), int(rows[0]), int(cols[-1]) + 1, int(rows[-1]) + 1
+
+
+def _expand_box(box: Box, margin: int, size: Tuple[int, int]) -> Box:
+    w, h = size
+    x0, y0, x1, y1 = box
+    return max(0, x0 - margin), max(0, y0 - margin), min(w, x1 + margin), min(h, y1 + margin)
+
+
+def _box_sum(a: np.ndarray, r: int) -> np.ndarray:
+    # (2r+1)^2 window sums from a summed-area table; outside the array counts as 0.
+    k = 2 * r + 1
+    h, w = a.shape
+    sat = np.zeros((h + k, w + k), dtype=np.int64)
+    sat[1:, 1:] = np.pad(a.astype(np.int32), r).cumsum(0).cumsum(1)
+    return sat[k:, k:] - sat[:-k, k:] - sat[k:, :-k] + sat[:-k, :-k]
+
+
+def _mask_dilate(mask: np.ndarray, radius: int) -> np.ndarray:
+    box = _mask_bbox(mask) if radius > 0 else None
+    if box is None:
+        return mask
+    # Only the bounding box plus the radius can change.
+    x0, y0, x1, y1 = _expand_box(box, radius, (mask.shape[1], mask.shape[0]))
+    out = np.zeros_like(mask)
+    out[y0:y1, x0:x1] = _box_sum(mask[y0:y1, x0:x1], radius) > 0
+    return out
+
+
+def _mask_feather(mask: np.ndarray, radius: int) -> np.ndarray:
+    """uint8 软蒙版：先膨胀 radius 再做 radius 的均值模糊，原蒙版内部保持 255。"""
+    if radius <= 0:
+        return mask.astype(np.uint8) * 255
+    grown = _mask_dilate(mask, radius)
+    out = np.zeros(mask.shape, dtype=np.uint8)
+    box = _mask_bbox(grown)
+    if box is None:
+        return out
+    x0, y0, x1, y1 = _expand_box(box, radius, (mask.shape[1], mask.shape[0]))
+    k2 = (2 * radius + 1) ** 2
+    # Edge-pad so pixels on the image/crop border are not averaged with zeros
+    # outside it; inside the region the padding is already empty.
+    region = np.pad(grown[y0:y1, x0:x1], radius, mode="edge")
+    out[y0:y1, x0:x1] = _box_sum(region, radius)[radius:-radius, radius:-radius] * 255 // k2
+    return out
+
+
+def _mask_to_layer(mask: np.ndarray, size: Tuple[int, int]) -> Image.Image:
+    # White brush layer for gr.ImageEditor, so saved masks show up again.
+    alpha = Image.fromarray(_resize_mask(mask, size).astype(np.uint8) * 255)
+    layer = Image.new("RGBA", alpha.size, (255, 255, 255, 0))
+    layer.putalpha(alpha)
+    return layer
+
+
+def _mask_to_png(mask: np.ndarray, level: int = 1) -> bytes:
+    # 1-bit PNG: half the encode time and a fraction of the size of an L mask; decodes to 0/255.
+    buf = io.BytesIO()
+    Image.fromarray(np.ascontiguousarray(mask, dtype=bool)).save(buf, format="PNG", compress_level=level)
+    return buf.getvalue()
+
+
+def _pack_mask(mask: np.ndarray) -> dict:
+    """
+    会话状态里保存的紧凑蒙版：只存外接框内的位图（1 bit/像素，再 zlib 压缩），
+    用到时再 _unpack_mask 还原成完整尺寸。
+    """
+    h, w = mask.shape
+    box = _mask_bbox(mask)
+    if box is None:
+        return {"shape": (h, w), "box": None, "bits": b""}
+    x0, y0, x1, y1 = box
+    bits = np.packbits(mask[y0:y1, x0:x1], axis=1)
+    return {"shape": (h, w), "box": box, "bits": zlib.compress(bits.tobytes(), 1)}
+
+
+def _unpack_mask(packed: dict) -> np.ndarray:
+    h, w = packed["shape"]
+    mask = np.zeros((h, w), dtype=bool)
+    box = packed.get("box")
+    if box is None:
+        return mask
+    x0, y0, x1, y1 = box
+    bits = np.frombuffer(zlib.decompress(packed["bits"]), dtype=np.uint8)
+    bits = bits.reshape(y1 - y0, -1)
+    mask[y0:y1, x0:x1] = np.unpackbits(bits, axis=1, count=x1 - x0).astype(bool)
+    return mask
@@ -1,34 +1,161 @@
 import os
+import io
+import time
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from collections import OrderedDict
 from typing import List, Tuple, Optional, Any, Dict
 
+import numpy as np
+import onnxruntime as ort
+from PIL import Image, ImageOps
 from rembg import remove as rembg_remove
-from rembg.session_factory import new_session
 from rembg.sessions import sessions_names, sessions_class
 
-from config import MODELS_DIR, REMBG_MODEL_PATH
+from config import (
+    MAX_CONCURRENCY,
+    MODELS_DIR,
+    REMBG_MODEL_PATH,
+    REMBG_BATCH_SIZE,
+    REMBG_WORKERS,
+    REMBG_INFER_MAX_SIDE,
+    REMBG_EDGE_SHARPEN,
+    REMBG_INTRA_OP_THREADS,
+    REMBG_INTER_OP_THREADS,
+    REMBG_GRAPH_OPT,
+    REMBG_MEM_ARENA,
+    REMBG_PRELOAD,
+    REMBG_SESSION_BUDGET_MB,
+    REMBG_SESSION_ERR_TTL,
+    REMBG_MASK_CACHE_DIR,
+    REMBG_MASK_CACHE_MB,
+)
+from cache_utils import DiskLRUCache, _cache_key, _file_digest
 from file_utils import (
     _normalize_files,
     _to_pil,
     _save_image_bytes,
-    _zip_bytes,
+    _ZipStream,
+    _imap_ordered,
     _write_preview,
     _pick_color,
     _apply_background,
 )
 
+logger = logging.getLogger(__name__)
+
 REMBG_MODEL_AUTO = "auto (REMBG_MODEL_PATH / u2net)"
 REMBG_MODEL_CUSTOM = "custom (REMBG_MODEL_PATH)"
 REMBG_EXCLUDE_MODELS = {"u2net_custom", "u2net_cloth_seg", "sam"}
 REMBG_MODELS = sorted([m for m in sessions_names if m not in REMBG_EXCLUDE_MODELS])
+REMBG_QUANT_SUFFIX = ".int8"
+
+# Loaded sessions in LRU order, with their estimated memory footprint.
+_REMBG_SESSIONS: "OrderedDict[str, Any]" = OrderedDict()
+_REMBG_SESSION_SIZES: Dict[str, int] = {}
+# key -> (error message, time.monotonic() when it failed)
+_REMBG_SESSION_ERRS: Dict[str, Tuple[str, float]] = {}
+_REMBG_SESSION_LOCK = threading.Lock()
+_REMBG_BUILD_LOCKS: Dict[str, threading.Lock] = {}
+_REMBG_MODEL_CLASSES = {cls.name(): cls for cls in sessions_class}
+_REMBG_POOL: Optional[ProcessPoolExecutor] = None
+_REMBG_POOL_LOCK = threading.Lock()
+_REMBG_MASK_CACHE = (
+    DiskLRUCache(REMBG_MASK_CACHE_DIR, REMBG_MASK_CACHE_MB * 1024 * 1024, suffix=".png")
+    if REMBG_MASK_CACHE_MB > 0
+    else None
+)
+
+# Models whose predict() is "normalize -> run -> min/max scale first output",
+# so several images can share one ONNX run: (mean, std, input size).
+_U2NET_SPEC = ((0.485, 0.456, 0.406), (0.229, 0.224, 0.225), (320, 320))
+_REMBG_BATCH_SPECS = {
+    "u2net": _U2NET_SPEC,
+    "u2netp": _U2NET_SPEC,
+    "u2net_human_seg": _U2NET_SPEC,
+    "u2net_custom": _U2NET_SPEC,
+    "silueta": _U2NET_SPEC,
+    "isnet-general-use": ((0.5, 0.5, 0.5), (1.0, 1.0, 1.0), (1024, 1024)),
+    "isnet-anime": ((0.485, 0.456, 0.406), (1.0, 1.0, 1.0), (1024, 1024)),
+}
+
+_ORT_GRAPH_OPT_LEVELS = {
+    "disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+
+def _model_local_path(model_name: str) -> str:
+    return os.path.join(MODELS_DIR, f"{model_name}.onnx")
+
+
+def _find_model_file(model_name: str) -> Optional[str]:
+    # rembg >= 2.0.7x keeps models in MODELS_DIR/models/<name>/; older ones used the flat layout.
+    path = _model_local_path(model_name)
+    if os.path.isfile(path):
+        return path
+    cls = _REMBG_MODEL_CLASSES.get(model_name)
+    resolve = getattr(cls, "resolve_existing", None)
+    return resolve(f"{cls.name()}.onnx") if resolve else None
+
+
+def _quantized_model_path(model_name: str) -> str:
+    return _model_local_path(f"{model_name}{REMBG_QUANT_SUFFIX}")
+
+
+def _list_quantized_models() -> Dict[str, str]:
+    # int8 copies written by tools/quantize_rembg.py; only U2Net-family graphs,
+    # because they are loaded through the u2net_custom session (same preprocessing).
+    found = {}
+    for name in REMBG_MODELS:
+        if _REMBG_BATCH_SPECS.get(name) is not _U2NET_SPEC:
+            continue
+        path = _quantized_model_path(name)
+        if os.path.isfile(path):
+            found[f"{name}{REMBG_QUANT_SUFFIX}"] = path
+    return found
+
+
+REMBG_QUANT_MODELS = _list_quantized_models()
 REMBG_MODEL_CHOICES = [REMBG_MODEL_AUTO]
 if REMBG_MODEL_PATH:
     REMBG_MODEL_CHOICES.append(REMBG_MODEL_CUSTOM)
 REMBG_MODEL_CHOICES.extend(REMBG_MODELS)
+REMBG_MODEL_CHOICES.extend(sorted(REMBG_QUANT_MODELS))
 REMBG_MODEL_DEFAULT = REMBG_MODEL_AUTO
 
-_REMBG_SESSIONS: Dict[str, Any] = {}
-_REMBG_SESSION_ERRS: Dict[str, str] = {}
-_REMBG_MODEL_CLASSES = {cls.name(): cls for cls in sessions_class}
+
+def _rembg_intra_threads() -> int:
+    if REMBG_INTRA_OP_THREADS > 0:
+        return REMBG_INTRA_OP_THREADS
+    # Concurrent jobs (Gradio concurrency or pool workers) each get a share of
+    # the cores instead of every session spinning up one thread per core.
+    parallel = REMBG_WORKERS if REMBG_WORKERS > 0 else MAX_CONCURRENCY
+    return max(1, (os.cpu_count() or 1) // max(1, parallel))
+
+
+def _rembg_sess_opts() -> ort.SessionOptions:
+    opts = ort.SessionOptions()
+    opts.intra_op_num_threads = _rembg_intra_threads()
+    if REMBG_INTER_OP_THREADS > 0:
+        opts.inter_op_num_threads = REMBG_INTER_OP_THREADS
+    opts.graph_optimization_level = _ORT_GRAPH_OPT_LEVELS.get(
+        REMBG_GRAPH_OPT, ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    )
+    opts.enable_cpu_mem_arena = REMBG_MEM_ARENA
+    return opts
+
+
+def _new_rembg_session(model_name: str, **kwargs):
+    # Build the session class directly so our SessionOptions are used on every
+    # rembg version (older new_session() does not accept sess_opts).
+    session_class = _REMBG_MODEL_CLASSES[model_name]
+    return session_class(model_name, _rembg_sess_opts(), **kwargs)
 
 
 def _rembg_session_key(model_name: str, model_path: Optional[str]) -> str:
@@ -46,36 +173,104 @@ def _resolve_rembg_choice(model_choice: Optional[str]) -> Tuple[str, Optional[st
         if not REMBG_MODEL_PATH:
             raise RuntimeError("REMBG_MODEL_PATH is not set.")
         return "u2net_custom", REMBG_MODEL_PATH
+    if model_choice in REMBG_QUANT_MODELS:
+        return "u2net_custom", REMBG_QUANT_MODELS[model_choice]
     return model_choice, None
 
 
+def _estimate_session_bytes(model_name: str, model_path: Optional[str]) -> int:
+    # Weights dominate; ONNX Runtime roughly doubles them with its buffers.
+    path = model_path or _find_model_file(model_name)
+    try:
+        return os.path.getsize(path) * 2
+    except (OSError, TypeError):
+        return 200 * 1024 * 1024
+
+
+def _store_rembg_session(key: str, session, size: int):
+    with _REMBG_SESSION_LOCK:
+        _REMBG_SESSIONS[key] = session
+        _REMBG_SESSION_SIZES[key] = size
+        if REMBG_SESSION_BUDGET_MB <= 0:
+            return
+        budget = REMBG_SESSION_BUDGET_MB * 1024 * 1024
+        # Never evict the session that was just loaded; in-flight batches
+        # keep their own reference, so eviction only drops the cache entry.
+        while sum(_REMBG_SESSION_SIZES.values()) > budget and len(_REMBG_SESSIONS) > 1:
+            old_key, _ = _REMBG_SESSIONS.popitem(last=False)
+            _REMBG_SESSION_SIZES.pop(old_key, None)
+
+
 def _get_rembg_session(model_choice: Optional[str]):
     model_name, model_path = _resolve_rembg_choice(model_choice)
     key = _rembg_session_key(model_name, model_path)
-    if key in _REMBG_SESSION_ERRS:
-        raise RuntimeError(_REMBG_SESSION_ERRS[key])
-    if key in _REMBG_SESSIONS:
-        return _REMBG_SESSIONS[key]
+    with _REMBG_SESSION_LOCK:
+        err = _REMBG_SESSION_ERRS.get(key)
+        if err is not None:
+            if time.monotonic() - err[1] < REMBG_SESSION_ERR_TTL:
+                raise RuntimeError(err[0])
+            del _REMBG_SESSION_ERRS[key]
+        if key in _REMBG_SESSIONS:
+            _REMBG_SESSIONS.move_to_end(key)
+            return _REMBG_SESSIONS[key]
+        build_lock = _REMBG_BUILD_LOCKS.setdefault(key, threading.Lock())
     if model_name != "u2net_custom" and model_name not in _REMBG_MODEL_CLASSES:
         raise RuntimeError(f"Unknown model: {model_name}")
-    try:
-        if model_name == "u2net_custom":
-            if not model_path:
-                raise RuntimeError("REMBG_MODEL_PATH is not set.")
-            if not os.path.isfile(model_path):
-                raise RuntimeError(f"REMBG_MODEL_PATH not found: {model_path}")
-            session = new_session("u2net_custom", model_path=model_path)
-        else:
-            session = new_session(model_name)
-        _REMBG_SESSIONS[key] = session
+
+    # One build per key; a second caller waits and then reuses the result.
+    with build_lock:
+        with _REMBG_SESSION_LOCK:
+            if key in _REMBG_SESSIONS:
+                _REMBG_SESSIONS.move_to_end(key)
+                return _REMBG_SESSIONS[key]
+        try:
+            if model_name == "u2net_custom":
+                if not model_path:
+                    raise RuntimeError("REMBG_MODEL_PATH is not set.")
+                if not os.path.isfile(model_path):
+                    raise RuntimeError(f"Model file not found: {model_path}")
+                session = _new_rembg_session("u2net_custom", model_path=model_path)
+            else:
+                session = _new_rembg_session(model_name)
+        except Exception as e:
+            with _REMBG_SESSION_LOCK:
+                _REMBG_SESSION_ERRS[key] = (str(e), time.monotonic())
+            raise
+        _store_rembg_session(key, session, _estimate_session_bytes(model_name, model_path))
         return session
-    except Exception as e:
-        _REMBG_SESSION_ERRS[key] = str(e)
-        raise
 
 
-def _model_local_path(model_name: str) -> str:
-    return os.path.join(MODELS_DIR, f"{model_name}.onnx")
+def _warm_up_rembg_session(session):
+    # First run pays for graph initialization and arena allocation.
+    _rembg_predict_masks(session, [Image.new("RGB", (64, 64), (255, 255, 255))])
+
+
+def _preload_rembg_sessions(model_choices: Optional[List[str]] = None):
+    for choice in (REMBG_PRELOAD if model_choices is None else model_choices):
+        try:
+            _warm_up_rembg_session(_get_rembg_session(choice))
+            logger.info("preloaded rembg model %s", choice)
+        except Exception as e:
+            logger.warning("preload of rembg model %s failed: %s", choice, e)
+
+
+def _rembg_worker_ready() -> int:
+    return os.getpid()
+
+
+def _start_rembg_preload() -> Optional[threading.Thread]:
+    if not REMBG_PRELOAD:
+        return None
+    if REMBG_WORKERS > 0:
+        # Worker processes load their own sessions in the pool initializer;
+        # one no-op per worker spawns them all now instead of on the first batch.
+        pool = _get_rembg_pool()
+        for _ in range(REMBG_WORKERS):
+            pool.submit(_rembg_worker_ready)
+        return None
+    t = threading.Thread(target=_preload_rembg_sessions, name="rembg-preload", daemon=True)
+    t.start()
+    return t
 
 
 def _list_rembg_models_status() -> Tuple[List[str], List[str]]:
@@ -156,6 +351,359 @@ def _download_rembg_model(model_choice: Optional[str]) -> str:
     return _format_model_status(model_choice, header=f"下载结果: {result}")
 
 
+# ---------- Batched inference ----------
+def _rembg_batch_spec(session) -> Optional[Tuple[Tuple[float, ...], Tuple[float, ...], Tuple[int, int]]]:
+    if getattr(session, "inner_session", None) is None:
+        return None
+    return _REMBG_BATCH_SPECS.get(getattr(session, "model_name", None))
+
+
+def _rembg_normalize(img: Image.Image, mean, std, size: Tuple[int, int]) -> np.ndarray:
+    # Same preprocessing as rembg BaseSession.normalize, without the batch axis.
+    arr = np.asarray(img.convert("RGB").resize(size, Image.LANCZOS), dtype=np.float32)
+    arr = arr / max(float(arr.max()), 1e-6)
+    arr = (arr - np.asarray(mean, dtype=np.float32)) / np.asarray(std, dtype=np.float32)
+    return arr.transpose((2, 0, 1))
+
+
+def _rembg_predict_masks(session, imgs: List[Image.Image]) -> List[Image.Image]:
+    spec = _rembg_batch_spec(session)
+    if spec is None:
+        return [session.predict(img)[0] for img in imgs]
+
+    mean, std, size = spec
+    inner = session.inner_session
+    input_meta = inner.get_inputs()[0]
+    tensor = np.stack([_rembg_normalize(img, mean, std, size) for img in imgs])
+
+    # Exported graphs with a fixed batch dim of 1 still get the shared preprocessing.
+    batch_dim = input_meta.shape[0] if input_meta.shape else None
+    if isinstance(batch_dim, int) and batch_dim > 0:
+        preds = [inner.run(None, {input_meta.name: tensor[i:i + 1]})[0][:, 0] for i in range(len(imgs))]
+        pred = np.concatenate(preds, axis=0)
+    else:
+        pred = inner.run(None, {input_meta.name: tensor})[0][:, 0]
+
+    masks = []
+    for img, p in zip(imgs, pred):
+        mi, ma = float(p.min()), float(p.max())
+        p = (p - mi) / max(ma - mi, 1e-6)
+        mask = Image.fromarray((p.clip(0, 1) * 255).astype(np.uint8), mode="L")
+        masks.append(mask.resize(img.size, Image.LANCZOS))
+    return masks
+
+
+def _open_for_inference(path: str, max_side: int) -> Tuple[Image.Image, bool]:
+    """
+    打开用于分割的图片；超过 max_side 时用 JPEG draft / reduce 缩小解码。
+    返回 (图片, 是否已缩小)。
+    """
+    img = Image.open(path)
+    reduced = False
+    if max_side > 0 and max(img.size) > max_side:
+        # JPEG: DCT scaling during decode (1/2, 1/4, 1/8), never below max_side.
+        img.draft("RGB", (max_side, max_side))
+        factor = max(img.size) // max_side
+        if factor > 1:
+            img = img.reduce(factor)
+        reduced = True
+    img = ImageOps.exif_transpose(img)
+    img.load()
+    return img, reduced
+
+
+def _refine_alpha(alpha: np.ndarray, scale: float) -> np.ndarray:
+    # Upsampling spreads the predicted edge over ~scale pixels; a contrast
+    # curve centred on 50% pulls it back to roughly the predicted width.
+    gain = min(max(scale, 1.0), 4.0)
+    t = np.clip((np.arange(256, dtype=np.float32) / 255.0 - 0.5) * gain + 0.5, 0.0, 1.0)
+    lut = (t * t * (3.0 - 2.0 * t) * 255.0 + 0.5).astype(np.uint8)
+    return lut[alpha]
+
+
+def _upsample_alpha(mask: Image.Image, size: Tuple[int, int]) -> Image.Image:
+    if mask.size == size:
+        return mask
+    scale = max(size[0] / max(mask.size[0], 1), size[1] / max(mask.size[1], 1))
+    up = mask.convert("L").resize(size, Image.BILINEAR)
+    if scale <= 1.0 or not REMBG_EDGE_SHARPEN:
+        return up
+    return Image.fromarray(_refine_alpha(np.asarray(up), scale), mode="L")
+
+
+def _rembg_cutout(img: Image.Image, mask: Image.Image) -> Image.Image:
+    rgba = img.convert("RGBA")
+    return Image.composite(rgba, Image.new("RGBA", rgba.size, 0), mask)
+
+
+def _export_nobg(
+    pil: Image.Image,
+    out_format: str,
+    quality: int,
+    jpg_color,
+    fill_bg: bool,
+    fill_color,
+    preset: Optional[str] = None,
+) -> bytes:
+    if fill_bg:
+        pil = _apply_background(pil, fill_color)
+    return _save_image_bytes(
+        pil,
+        out_format,
+        quality=int(quality),
+        bg_color=fill_color if fill_bg else jpg_color,
+        preset=preset,
+    )
+
+
+def _rembg_cache_ns(model_choice: Optional[str]) -> str:
+    # Everything that changes the predicted mask for the same input bytes.
+    model_name, model_path = _resolve_rembg_choice(model_choice)
+    ns = _rembg_session_key(model_name, model_path)
+    if model_path:
+        try:
+            ns = f"{ns}@{int(os.path.getmtime(model_path))}"
+        except OSError:
+            pass
+    return f"{ns}|side={REMBG_INFER_MAX_SIDE}"
+
+
+def _mask_cache_get(key: Optional[str]) -> Optional[Image.Image]:
+    if _REMBG_MASK_CACHE is None or key is None:
+        return None
+    data = _REMBG_MASK_CACHE.get(key)
+    if data is None:
+        return None
+    try:
+        mask = Image.open(io.BytesIO(data))
+        mask.load()
+        return mask
+    except Exception:
+        return None
+
+
+def _mask_cache_put(key: Optional[str], mask: Image.Image):
+    if _REMBG_MASK_CACHE is None or key is None:
+        return
+    buf = io.BytesIO()
+    mask.convert("L").save(buf, format="PNG", compress_level=1)
+    _REMBG_MASK_CACHE.put(key, buf.getvalue())
+
+
+def _remove_bg_chunk(
+    paths: List[str],
+    session,
+    out_format: str,
+    quality: int,
+    jpg_color,
+    fill_bg: bool,
+    fill_color,
+    cache_ns: Optional[str] = None,
+    preset: Optional[str] = None,
+) -> List[Tuple[str, Optional[bytes], Optional[str]]]:
+    """
+    处理一批图片，返回与 paths 同序的 (base, out_bytes, log)。
+    模型能批量推理时整批只跑一次 ONNX，否则逐张 predict。
+    大图先在缩小图上推理，原图在导出时才逐张解码。
+    蒙版按 (文件内容, 模型) 缓存，命中时跳过推理，只重新合成与编码。
+    """
+    results: List[Tuple[str, Optional[bytes], Optional[str]]] = []
+    items = []
+    for p in paths:
+        base = os.path.splitext(os.path.basename(p))[0]
+        try:
+            key = None
+            if cache_ns is not None and _REMBG_MASK_CACHE is not None:
+                key = _cache_key(cache_ns, _file_digest(p))
+            mask = _mask_cache_get(key)
+            img, reduced = (None, True) if mask is not None else _open_for_inference(p, REMBG_INFER_MAX_SIDE)
+            items.append({"slot": len(results), "path": p, "img": img, "reduced": reduced, "mask": mask, "key": key})
+            results.append((base, None, None))
+        except Exception as e:
+            results.append((base, None, f"[{base}] read failed: {e}"))
+
+    todo = [it for it in items if it["mask"] is None]
+    if todo:
+        imgs = [it["img"] for it in todo]
+        try:
+            masks = _rembg_predict_masks(session, imgs)
+        except Exception:
+            # One bad image should not fail the whole batch: retry one by one.
+            masks = []
+            for img in imgs:
+                try:
+                    masks.append(_rembg_predict_masks(session, [img])[0])
+                except Exception as e:
+                    masks.append(e)
+        for it, mask in zip(todo, masks):
+            it["mask"] = mask
+            if not isinstance(mask, Exception):
+                _mask_cache_put(it["key"], mask)
+
+    def _finish(it) -> bytes:
+        mask = it["mask"]
+        if isinstance(mask, Exception):
+            raise mask
+        img = it["img"]
+        if it["reduced"]:
+            img = ImageOps.exif_transpose(Image.open(it["path"]))
+            mask = _upsample_alpha(mask, img.size)
+        cut = _rembg_cutout(img, mask)
+        return _export_nobg(cut, out_format, quality, jpg_color, fill_bg, fill_color, preset)
+
+    def _finish_safe(it):
+        try:
+            return _finish(it), None
+        except Exception as e:
+            return None, e
+
+    # Full-size decode, cutout and encode per image run on the encode pool.
+    for it, (out_bytes, err) in zip(items, _imap_ordered(_finish_safe, items)):
+        slot = it["slot"]
+        base = results[slot][0]
+        if err is not None:
+            results[slot] = (base, None, f"[{base}] remove-bg/export failed: {err}")
+        else:
+            results[slot] = (base, out_bytes, None)
+    return results
+
+
+def _remove_bg_single(
+    path: str,
+    session,
+    out_format: str,
+    quality: int,
+    jpg_color,
+    fill_bg: bool,
+    fill_color,
+    preset: Optional[str] = None,
+) -> Tuple[str, Optional[bytes], Optional[str]]:
+    base = os.path.splitext(os.path.basename(path))[0]
+    try:
+        raw = open(path, "rb").read()
+        cut = rembg_remove(raw, session=session)
+        pil = _to_pil(cut).convert("RGBA")
+        out_bytes = _export_nobg(pil, out_format, quality, jpg_color, fill_bg, fill_color, preset)
+    except Exception as e:
+        return base, None, f"[{base}] remove-bg/export failed: {e}"
+    return base, out_bytes, None
+
+
+def _remove_bg_paths(
+    paths: List[str],
+    session,
+    out_format: str,
+    quality: int,
+    jpg_color,
+    fill_bg: bool,
+    fill_color,
+    cache_ns: Optional[str] = None,
+    preset: Optional[str] = None,
+) -> List[Tuple[str, Optional[bytes], Optional[str]]]:
+    if REMBG_BATCH_SIZE == 1 and REMBG_INFER_MAX_SIDE == 0 and _REMBG_MASK_CACHE is None:
+        return [_remove_bg_single(p, session, out_format, quality, jpg_color, fill_bg, fill_color, preset) for p in paths]
+    return _remove_bg_chunk(paths, session, out_format, quality, jpg_color, fill_bg, fill_color, cache_ns, preset)
+
+
+# ---------- Process pool ----------
+def _get_rembg_pool() -> ProcessPoolExecutor:
+    global _REMBG_POOL
+    with _REMBG_POOL_LOCK:
+        if _REMBG_POOL is None:
+            # spawn: forking a threaded Gradio/ONNX process is not safe.
+            _REMBG_POOL = ProcessPoolExecutor(
+                max_workers=REMBG_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_preload_rembg_sessions,
+            )
+        return _REMBG_POOL
+
+
+def _reset_rembg_pool(pool: ProcessPoolExecutor):
+    global _REMBG_POOL
+    with _REMBG_POOL_LOCK:
+        if _REMBG_POOL is pool:
+            _REMBG_POOL = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _remove_bg_worker(
+    paths: List[str],
+    model_choice: Optional[str],
+    out_format: str,
+    quality: int,
+    jpg_color,
+    fill_bg: bool,
+    fill_color,
+    cache_ns: Optional[str] = None,
+    preset: Optional[str] = None,
+) -> List[Tuple[str, Optional[bytes], Optional[str]]]:
+    # Runs inside a pool worker: _REMBG_SESSIONS here belongs to that process,
+    # so each worker builds its own session on first use and keeps it.
+    try:
+        session = _get_rembg_session(model_choice)
+    except Exception as e:
+        bases = [os.path.splitext(os.path.basename(p))[0] for p in paths]
+        return [(base, None, f"[{base}] rembg session failed: {e}") for base in bases]
+    return _remove_bg_paths(paths, session, out_format, quality, jpg_color, fill_bg, fill_color, cache_ns, preset)
+
+
+def _iter_remove_bg_pool(
+    input_paths: List[str],
+    model_choice: Optional[str],
+    out_format: str,
+    quality: int,
+    jpg_color,
+    fill_bg: bool,
+    fill_color,
+    cache_ns: Optional[str] = None,
+    preset: Optional[str] = None,
+):
+    pool = _get_rembg_pool()
+    # Small batches are split finer so every worker gets a share.
+    per_worker = -(-len(input_paths) // REMBG_WORKERS)
+    size = max(1, min(REMBG_BATCH_SIZE, per_worker))
+    chunks = [input_paths[i:i + size] for i in range(0, len(input_paths), size)]
+    futures = [
+        pool.submit(
+            _remove_bg_worker,
+            chunk, model_choice, out_format, int(quality), jpg_color, fill_bg, fill_color, cache_ns, preset,
+        )
+        for chunk in chunks
+    ]
+    # Wait in submission order so results stream back in input order.
+    for chunk, fut in zip(chunks, futures):
+        try:
+            yield from fut.result()
+        except BrokenProcessPool as e:
+            _reset_rembg_pool(pool)
+            for p in chunk:
+                base = os.path.splitext(os.path.basename(p))[0]
+                yield base, None, f"[{base}] worker crashed: {e}"
+        except Exception as e:
+            for p in chunk:
+                base = os.path.splitext(os.path.basename(p))[0]
+                yield base, None, f"[{base}] remove-bg/export failed: {e}"
+
+
+def _iter_remove_bg_local(
+    input_paths: List[str],
+    session,
+    out_format: str,
+    quality: int,
+    jpg_color,
+    fill_bg: bool,
+    fill_color,
+    cache_ns: Optional[str] = None,
+    preset: Optional[str] = None,
+):
+    for start in range(0, len(input_paths), REMBG_BATCH_SIZE):
+        chunk = input_paths[start:start + REMBG_BATCH_SIZE]
+        yield from _remove_bg_paths(
+            chunk, session, out_format, quality, jpg_color, fill_bg, fill_color, cache_ns, preset
+        )
+
+
 # ---------- Remove BG ----------
 def batch_remove_bg(
     input_files: Any,
@@ -165,44 +713,49 @@ def batch_remove_bg(
     fill_bg: bool,
     fill_color: str,
     model_choice: str,
+    preset: Optional[str] = None,
 ):
     input_paths = _normalize_files(input_files)
     if not input_paths:
         return [], None, "No input files."
 
     try:
-        session = _get_rembg_session(model_choice)
+        cache_ns = _rembg_cache_ns(model_choice)
+        session = None if REMBG_WORKERS > 0 else _get_rembg_session(model_choice)
     except Exception as e:
         return [], None, f"rembg session failed: {e}"
 
     jpg_color = _pick_color(jpg_bg, (255, 255, 255))
     fill_color = _pick_color(fill_color, jpg_color)
     outputs_gallery = []
-    outputs_zip_items = []
+    zip_out = _ZipStream()
     logs = []
 
-    for p in input_paths:
-        base = os.path.splitext(os.path.basename(p))[0]
-        try:
-            raw = open(p, "rb").read()
-            cut = rembg_remove(raw, session=session)
-            pil = _to_pil(cut).convert("RGBA")
-            if fill_bg:
-                pil = _apply_background(pil, fill_color)
-            out_bytes = _save_image_bytes(
-                pil,
-                out_format,
-                quality=int(quality),
-                bg_color=fill_color if fill_bg else jpg_color,
-            )
-        except Exception as e:
-            logs.append(f"[{base}] remove-bg/export failed: {e}")
-            continue
+    if session is None:
+        results = _iter_remove_bg_pool(
+            input_paths, model_choice, out_format, quality, jpg_color, fill_bg, fill_color, cache_ns, preset
+        )
+    else:
+        results = _iter_remove_bg_local(
+            input_paths, session, out_format, quality, jpg_color, fill_bg, fill_color, cache_ns, preset
+        )
+
+    ext = out_format.lower().replace("jpeg", "jpg")
 
-        ext = out_format.lower().replace("jpeg", "jpg")
+    def _with_preview(item):
+        base, out_bytes, log = item
+        if out_bytes is None:
+            return None, None, None, log
         name = f"{base}_nobg.{ext}"
-        outputs_zip_items.append((name, out_bytes))
-        outputs_gallery.append(_write_preview(name, out_bytes))
+        return name, out_bytes, _write_preview(name, out_bytes), None
+
+    # Thumbnails are made on the encode pool while the next chunk is still cutting.
+    for name, out_bytes, preview, log in _imap_ordered(_with_preview, results):
+        if out_bytes is None:
+            logs.append(log)
+            continue
+        zip_out.add(name, out_bytes)
+        outputs_gallery.append(preview)
 
-    zip_path = _zip_bytes(outputs_zip_items)
+    zip_path = zip_out.close()
     return outputs_gallery, zip_path, ("\n".join(logs) if logs else "OK")
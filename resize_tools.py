@@ -1,15 +1,17 @@
 import os
-from typing import Any
+import math
+from typing import Any, Optional
 
 from PIL import Image, ImageOps
 
+from config import RESIZE_WORKERS, RESIZE_MEMORY_MB
 from file_utils import (
     _normalize_files,
     _save_image_bytes,
     _pick_color,
     _write_preview,
-    _zip_bytes,
-    _to_pil,
+    _ZipStream,
+    _imap_ordered,
     _pad_to_target,
 )
 
@@ -46,6 +48,25 @@ def _resize_one(
     return img
 
 
+def _draft_for(img: Image.Image, w: int, h: int, mode: str):
+    # JPEG: let the decoder downscale (1/2..1/8) while staying above the size the resize needs.
+    fit = max if mode == "Crop" else min
+    scale = fit(w / img.width, h / img.height)
+    if scale < 1:
+        img.draft("RGB", (math.ceil(img.width * scale), math.ceil(img.height * scale)))
+
+
+def _decoded_cost(path: str) -> int:
+    # Source decode plus the RGBA working copy; read from the header only.
+    try:
+        with Image.open(path) as img:
+            w, h = img.size
+            bands = len(img.getbands())
+    except Exception:
+        return 0
+    return w * h * (bands + 4)
+
+
 def batch_resize(
     input_files: Any,
     target_w: int,
@@ -55,6 +76,7 @@ def batch_resize(
     quality: int,
     pad_color: str,
     force_exact: bool,
+    preset: Optional[str] = None,
 ):
     input_paths = _normalize_files(input_files)
     if not input_paths:
@@ -62,33 +84,44 @@ def batch_resize(
 
     c = _pick_color(pad_color, (255, 255, 255))
     outputs_gallery = []
-    outputs_zip_items = []
+    zip_out = _ZipStream()
     logs = []
 
-    for p in input_paths:
+    ext = out_format.lower().replace("jpeg", "jpg")
+
+    def _one(p):
+        # Decode, resize, encode and thumbnail run together on the encode pool.
         base = os.path.splitext(os.path.basename(p))[0]
+        name = f"{base}_{int(target_w)}x{int(target_h)}_{mode.lower()}.{ext}"
         try:
-            img = Image.open(p)
-            out_img = _resize_one(
-                img,
-                int(target_w),
-                int(target_h),
-                mode,
-                pad_color=c,
-                force_exact=force_exact,
-            )
-            out_bytes = _save_image_bytes(out_img, out_format, quality=int(quality), bg_color=c)
+            with Image.open(p) as img:
+                _draft_for(img, int(target_w), int(target_h), mode)
+                out_img = _resize_one(
+                    img,
+                    int(target_w),
+                    int(target_h),
+                    mode,
+                    pad_color=c,
+                    force_exact=force_exact,
+                )
+            out_bytes = _save_image_bytes(out_img, out_format, quality=int(quality), bg_color=c, preset=preset)
         except Exception as e:
-            logs.append(f"[{base}] resize/export failed: {e}")
-            continue
+            return name, None, None, f"[{base}] resize/export failed: {e}"
+        return name, out_bytes, _write_preview(name, out_bytes, out_img), None
 
-        ext = out_format.lower().replace("jpeg", "jpg")
-        name = f"{base}_{int(target_w)}x{int(target_h)}_{mode.lower()}.{ext}"
-        outputs_zip_items.append((name, out_bytes))
-        try:
-            outputs_gallery.append(_to_pil(out_bytes).copy())
-        except Exception:
-            outputs_gallery.append(_write_preview(name, out_bytes))
+    results = _imap_ordered(
+        _one,
+        input_paths,
+        window=RESIZE_WORKERS,
+        cost=_decoded_cost,
+        budget=RESIZE_MEMORY_MB * 1024 * 1024,
+    )
+    for name, out_bytes, preview, log in results:
+        if out_bytes is None:
+            logs.append(log)
+            continue
+        zip_out.add(name, out_bytes)
+        outputs_gallery.append(preview)
 
-    zip_path = _zip_bytes(outputs_zip_items)
+    zip_path = zip_out.close()
     return outputs_gallery, zip_path, ("\n".join(logs) if logs else "OK")
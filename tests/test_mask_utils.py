@@ -0,0 +1,22 @@
+import numpy as np
+
+from mask_utils import _mask_feather
+
+
+def test_feather_keeps_border_mask_opaque():
+    mask = np.zeros((40, 60), dtype=bool)
+    mask[:10, :15] = True  # touches the top and left edge, including the corner
+    mask[25:, 50:] = True  # touches the bottom and right edge
+    out = _mask_feather(mask, 4)
+    assert out.dtype == np.uint8
+    assert (out[mask] == 255).all()
+    assert out[0, 0] == 255 and out[-1, -1] == 255
+
+
+def test_feather_softens_outside_the_mask():
+    mask = np.zeros((40, 40), dtype=bool)
+    mask[15:25, 15:25] = True
+    out = _mask_feather(mask, 3)
+    assert (out[mask] == 255).all()
+    assert 0 < out[15, 13] < 255
+    assert out[0, 0] == 0
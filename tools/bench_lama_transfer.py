@@ -0,0 +1,124 @@
+import argparse
+import io
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+os.chdir(ROOT)
+sys.path.insert(0, str(ROOT))
+
+import httpx
+import numpy as np
+from PIL import Image
+
+from file_utils import _ImageHandle
+from lama_client import _encode_multipart
+from mask_utils import _mask_to_png
+from inpaint_tools import _lama_form_defaults
+
+PNG_LEVELS = [0, 1, 3, 6, 9]
+
+
+def _timed(fn, repeat: int):
+    times = []
+    out = None
+    for _ in range(repeat):
+        t = time.perf_counter()
+        out = fn()
+        times.append(time.perf_counter() - t)
+    return out, statistics.median(times)
+
+
+def _png(img: Image.Image, level: int) -> bytes:
+    buf = io.BytesIO()
+    img.save(buf, format="PNG", compress_level=level)
+    return buf.getvalue()
+
+
+def _mask_l_png(mask: np.ndarray, level: int) -> bytes:
+    buf = io.BytesIO()
+    Image.fromarray(mask.astype(np.uint8) * 255).save(buf, format="PNG", compress_level=level)
+    return buf.getvalue()
+
+
+def _test_mask(size, ratio: float) -> np.ndarray:
+    w, h = size
+    mask = np.zeros((h, w), dtype=bool)
+    mw, mh = max(1, int(w * ratio)), max(1, int(h * ratio))
+    mask[(h - mh) // 2:(h + mh) // 2, (w - mw) // 2:(w + mw) // 2] = True
+    return mask
+
+
+def _post(client: httpx.Client, server: str, image_file, mask_bytes: bytes, size) -> float:
+    body, content_type = _encode_multipart(
+        _lama_form_defaults(size),
+        {"image": image_file, "mask": ("mask.png", mask_bytes, "image/png")},
+    )
+    t = time.perf_counter()
+    r = client.post(f"{server}/inpaint", content=body, headers={"Content-Type": content_type})
+    r.raise_for_status()
+    # Decode the answer too: it is part of the per-image cost on our side.
+    Image.open(io.BytesIO(r.content)).load()
+    return time.perf_counter() - t
+
+
+def _bench(path: str, servers, repeat: int, mask_ratio: float):
+    handle = _ImageHandle.from_path(path)
+    img = handle.image
+    if img.mode not in ("L", "RGB", "RGBA"):
+        img = img.convert("RGBA")
+    mask = _test_mask(img.size, mask_ratio)
+    print(f"\n{os.path.basename(path)}  {img.size[0]}x{img.size[1]} {handle.format}  file {len(handle.data) / 1024:.0f} KB")
+
+    cases = [(f"as-is ({handle.format})", lambda: handle.data)]
+    cases += [(f"png level {lvl}", lambda lvl=lvl: _png(img, lvl)) for lvl in PNG_LEVELS]
+    payloads = []
+    print(f"  {'image payload':<20}{'encode ms':>10}{'KB':>10}")
+    for name, fn in cases:
+        data, sec = _timed(fn, repeat)
+        payloads.append((name, data))
+        print(f"  {name:<20}{sec * 1000:>10.1f}{len(data) / 1024:>10.0f}")
+
+    print(f"  {'mask payload':<20}{'encode ms':>10}{'KB':>10}")
+    mask_bytes = None
+    for name, fn in (
+        ("L png level 6", lambda: _mask_l_png(mask, 6)),
+        ("L png level 1", lambda: _mask_l_png(mask, 1)),
+        ("1-bit png level 1", lambda: _mask_to_png(mask, 1)),
+    ):
+        data, sec = _timed(fn, repeat)
+        mask_bytes = data
+        print(f"  {name:<20}{sec * 1000:>10.1f}{len(data) / 1024:>10.0f}")
+
+    for server in servers:
+        print(f"  round trip to {server} (median of {repeat}, incl. decoding the answer)")
+        with httpx.Client(timeout=300) as client:
+            for name, data in payloads:
+                mime = "image/png" if name.startswith("png") else Image.MIME.get(handle.format, "application/octet-stream")
+                image_file = ("image", data, mime)
+                try:
+                    times = [_post(client, server, image_file, mask_bytes, img.size) for _ in range(repeat)]
+                except httpx.HTTPError as e:
+                    print(f"    {name:<20}failed: {e}")
+                    continue
+                print(f"    {name:<20}{statistics.median(times) * 1000:>10.1f} ms")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Measure encode cost vs upload size for lama-cleaner payloads")
+    parser.add_argument("images", nargs="+", help="sample images")
+    parser.add_argument("--server", action="append", default=[], help="lama-cleaner URL, repeat for local and remote")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--mask-ratio", type=float, default=0.3, help="mask side as a share of the image side")
+    args = parser.parse_args()
+    servers = [s.rstrip("/") for s in args.server]
+    for path in args.images:
+        _bench(path, servers, max(1, args.repeat), args.mask_ratio)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
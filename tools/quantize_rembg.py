@@ -0,0 +1,74 @@
+import argparse
+import os
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+# config.MODELS_DIR is relative to the working directory, same as app.py.
+os.chdir(ROOT)
+sys.path.insert(0, str(ROOT))
+
+from rembg_tools import (
+    REMBG_MODELS,
+    _REMBG_BATCH_SPECS,
+    _REMBG_MODEL_CLASSES,
+    _U2NET_SPEC,
+    _find_model_file,
+    _model_local_path,
+    _quantized_model_path,
+)
+
+QUANTIZABLE_MODELS = [m for m in REMBG_MODELS if _REMBG_BATCH_SPECS.get(m) is _U2NET_SPEC]
+
+
+def _quantize(model_name: str, download: bool, force: bool) -> bool:
+    dst = _quantized_model_path(model_name)
+    if os.path.isfile(dst) and not force:
+        print(f"[{model_name}] exists, skip: {dst}")
+        return True
+    src = _find_model_file(model_name)
+    if src is None:
+        if not download:
+            print(f"[{model_name}] missing {_model_local_path(model_name)} (use --download)")
+            return False
+        print(f"[{model_name}] downloading ...")
+        src = _REMBG_MODEL_CLASSES[model_name].download_models()
+
+    try:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+    except ImportError as e:
+        print(f"onnxruntime.quantization unavailable ({e}); pip install onnx")
+        return False
+
+    tmp = f"{dst}.tmp"
+    # Dynamic (weight-only) int8: no calibration set needed. ConvInteger on CPU
+    # expects unsigned weights.
+    quantize_dynamic(src, tmp, weight_type=QuantType.QUInt8)
+    os.replace(tmp, dst)
+    src_mb = os.path.getsize(src) / 1024 / 1024
+    dst_mb = os.path.getsize(dst) / 1024 / 1024
+    print(f"[{model_name}] {src_mb:.1f} MB -> {dst_mb:.1f} MB: {dst}")
+    return True
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Write int8-quantized rembg models into MODELS_DIR")
+    parser.add_argument("models", nargs="*", default=["u2net"], help=f"choices: {', '.join(QUANTIZABLE_MODELS)}")
+    parser.add_argument("--download", action="store_true", help="download the fp32 model first if missing")
+    parser.add_argument("--force", action="store_true", help="overwrite an existing int8 model")
+    args = parser.parse_args()
+
+    ok = True
+    for name in args.models:
+        if name not in QUANTIZABLE_MODELS:
+            print(f"[{name}] not supported, choices: {', '.join(QUANTIZABLE_MODELS)}")
+            ok = False
+            continue
+        ok = _quantize(name, args.download, args.force) and ok
+    if ok:
+        print("Restart the UI to see the new models in the model dropdown.")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,7 +5,7 @@ import gradio as gr
 from config import (
     UI_CSS,
     MAX_CONCURRENCY,
-    LAMA_SERVER,
+    LAMA_SERVERS,
     PREVIEW_HEIGHT,
     EDITOR_HEIGHT,
     EDITOR_CANVAS_SIZE,
@@ -13,8 +13,9 @@ from config import (
     COMPRESS_FORMAT_CHOICES,
     COMPRESS_FORMAT_AUTO,
     EDITOR_SLOTS,
+    ENCODE_PRESETS,
+    ENCODE_PRESET_DEFAULT,
 )
-from file_utils import _normalize_files, _make_zoom_image, _make_editor_image
 from rembg_tools import (
     REMBG_MODEL_CHOICES,
     REMBG_MODEL_DEFAULT,
@@ -27,8 +28,11 @@ from inpaint_tools import (
     inpaint_single_ui,
     _open_zoom_editor,
     _save_zoom_mask,
+    _pan_zoom_editor,
     _close_zoom_editor,
-    _reset_mask_overrides,
+    _load_editor_page,
+    _change_editor_page,
+    _reset_editor_pages,
 )
 from resize_tools import batch_resize
 from compress_tools import batch_compress
@@ -41,7 +45,7 @@ def build_demo():
     ) as demo:
         gr.Markdown(
             "##  免费可视化批量图片处理：扣白底 / 去 Logo / 改尺寸 / 压缩\n"
-            f"- inpaint 引擎：lama-cleaner server: {LAMA_SERVER}\n"
+            f"- inpaint 引擎：lama-cleaner server: {', '.join(url for url, _ in LAMA_SERVERS)}\n"
             "- 扣白底：rembg\n"
             "- 改尺寸：Pillow\n"
             "- 压缩：Pillow\n"
@@ -51,6 +55,7 @@ def build_demo():
             files_bg = gr.Files(label="拖拽上传多张图片", file_types=["image"])
             out_fmt_bg = gr.Dropdown(["PNG", "WEBP", "JPG"], value="PNG", label="输出格式")
             quality_bg = gr.Slider(50, 100, value=92, step=1, label="质量（JPG/WEBP 有效）")
+            preset_bg = gr.Dropdown(ENCODE_PRESETS, value=ENCODE_PRESET_DEFAULT, label="编码速度（fast 最快 / smallest 体积最小）")
             jpg_bg = gr.Dropdown(["white", "gray", "black"], value="white", label="JPG 背景色（JPG 输出用）")
             with gr.Row():
                 rembg_model = gr.Dropdown(REMBG_MODEL_CHOICES, value=REMBG_MODEL_DEFAULT, label="扣白底模型")
@@ -77,7 +82,7 @@ def build_demo():
             )
             btn_bg.click(
                 fn=batch_remove_bg,
-                inputs=[files_bg, out_fmt_bg, quality_bg, jpg_bg, fill_bg, fill_color, rembg_model],
+                inputs=[files_bg, out_fmt_bg, quality_bg, jpg_bg, fill_bg, fill_color, rembg_model, preset_bg],
                 outputs=[gallery_bg, zip_bg, log_bg],
                 concurrency_limit=MAX_CONCURRENCY,
             )
@@ -89,7 +94,7 @@ def build_demo():
                 "2) 对每张图用画笔涂抹要移除区域（白色=擦除）\n"
                 "3) 点击批量处理\n"
                 "\n"
-                "（最多 8 张，超过请分批）"
+                f"（编辑器每页 {EDITOR_SLOTS} 张，翻页后已涂抹的蒙版会保留）"
             )
 
             files_lp = gr.Files(label="拖拽上传多张图片", file_types=["image"])
@@ -97,13 +102,21 @@ def build_demo():
             with gr.Row():
                 out_fmt_lp = gr.Dropdown(["PNG", "WEBP", "JPG"], value="PNG", label="输出格式")
                 quality_lp = gr.Slider(50, 100, value=92, step=1, label="质量（JPG/WEBP 有效）")
+                preset_lp = gr.Dropdown(ENCODE_PRESETS, value=ENCODE_PRESET_DEFAULT, label="编码速度（fast 最快 / smallest 体积最小）")
                 zoom_lp = gr.Dropdown(EDITOR_ZOOM_CHOICES, value=1, label="放大编辑倍数")
+                template_lp = gr.Checkbox(value=False, label="模板蒙版：第一张涂过的蒙版按比例用于全部图片")
                 btn_lp = gr.Button("开始批量去 Logo（inpaint）")
             log_lp = gr.Textbox(label="日志", lines=6, value="等待点击", interactive=False)
             mask_overrides = gr.State({})
+            page_masks = gr.State({})
+            page_state = gr.State(0)
             zoom_state = gr.State({})
 
-            gr.Markdown("#### Mask 编辑器（最多 8 张）")
+            gr.Markdown("#### Mask 编辑器")
+            with gr.Row():
+                btn_prev = gr.Button("上一页", size="sm")
+                page_info = gr.Markdown("第 1 / 1 页（共 0 张）")
+                btn_next = gr.Button("下一页", size="sm")
             editors = []
             previews = []
             single_btns = []
@@ -119,30 +132,26 @@ def build_demo():
                         elem_classes=["mask-editor"]
                     )
                 with gr.Column(scale=0, min_width=140):
-                    btn_one = gr.Button(f"只处理第 {i+1} 张")
+                    btn_one = gr.Button("只处理这张")
                     btn_zoom = gr.Button("放大编辑", variant="secondary", size="sm")
                 previews.append(img_prev)
                 editors.append(ed)
                 single_btns.append(btn_one)
                 zoom_btns.append(btn_zoom)
 
-            def _load_previews(files, zoom):
-                #  关键：把 Files 先变成 path 列表
-                paths = _normalize_files(files)
-                outs = []
-                editor_outs = []
-                for i in range(EDITOR_SLOTS):
-                    p = paths[i] if i < len(paths) else None
-                    outs.append(p)
-                    editor_outs.append(_make_editor_image(p, EDITOR_CANVAS_SIZE) if p else None)
-
-                # 对 editor 的初始值：优先给 “背景图”
-                # 兼容大多数 gradio 4.x：直接 path
-                return outs + editor_outs
-
-            files_lp.change(fn=_load_previews, inputs=[files_lp, zoom_lp], outputs=previews + editors)
-            zoom_lp.change(fn=_load_previews, inputs=[files_lp, zoom_lp], outputs=previews + editors)
-            files_lp.change(fn=_reset_mask_overrides, outputs=[mask_overrides], queue=False)
+            page_outputs = [page_state, page_info] + previews + editors
+            files_lp.change(fn=_reset_editor_pages,
+                            outputs=[page_state, mask_overrides, page_masks],
+                            queue=False).then(
+                                fn=_load_editor_page,
+                                inputs=[files_lp, page_state, page_masks],
+                                outputs=page_outputs)
+            for btn_page, delta in ((btn_prev, -1), (btn_next, 1)):
+                btn_page.click(
+                    fn=functools.partial(_change_editor_page, delta=delta),
+                    inputs=[files_lp, page_state, page_masks] + editors,
+                    outputs=[page_masks] + page_outputs,
+                )
 
             with gr.Column(visible=False, elem_id="zoom-panel") as zoom_panel:
                 zoom_title = gr.Markdown("### 放大编辑")
@@ -152,6 +161,10 @@ def build_demo():
                     height=EDITOR_HEIGHT,
                     elem_classes=["mask-editor"]
                 )
+                with gr.Row():
+                    zoom_x = gr.Slider(0, 100, value=50, step=1, label="水平位置（%）")
+                    zoom_y = gr.Slider(0, 100, value=50, step=1, label="垂直位置（%）")
+                    zoom_pan = gr.Button("移动放大区域", size="sm")
                 with gr.Row():
                     zoom_save = gr.Button("保存并关闭")
                     zoom_close = gr.Button("关闭")
@@ -163,7 +176,7 @@ def build_demo():
                          outputs=[log_lp],
                          queue=False).then(
                              fn=batch_inpaint_ui,
-                             inputs=[files_lp] + editors + [out_fmt_lp, quality_lp, mask_overrides],
+                             inputs=[files_lp, page_state, page_masks] + editors + [out_fmt_lp, quality_lp, mask_overrides, template_lp, preset_lp],
                              outputs=[gallery_lp, zip_lp, log_lp],
                              concurrency_limit=MAX_CONCURRENCY)
 
@@ -172,17 +185,23 @@ def build_demo():
                               outputs=[log_lp],
                               queue=False).then(
                                   fn=functools.partial(inpaint_single_ui, index=i),
-                                  inputs=[files_lp, editors[i], out_fmt_lp, quality_lp, mask_overrides],
+                                  inputs=[files_lp, page_state, editors[i], out_fmt_lp, quality_lp, mask_overrides, preset_lp],
                                   outputs=[previews[i], gallery_lp, zip_lp, log_lp],
                                   concurrency_limit=MAX_CONCURRENCY)
 
             for i, btn_zoom in enumerate(zoom_btns):
                 btn_zoom.click(
                     fn=functools.partial(_open_zoom_editor, index=i),
-                    inputs=[files_lp, zoom_lp],
-                    outputs=[zoom_panel, zoom_title, zoom_editor, zoom_state, log_lp],
+                    inputs=[files_lp, zoom_lp, page_state, editors[i], mask_overrides],
+                    outputs=[zoom_panel, zoom_title, zoom_editor, zoom_state, zoom_x, zoom_y, log_lp],
                 )
 
+            zoom_pan.click(
+                fn=_pan_zoom_editor,
+                inputs=[zoom_editor, zoom_state, zoom_x, zoom_y],
+                outputs=[zoom_editor, zoom_state, zoom_title, log_lp],
+            )
+
             zoom_save.click(
                 fn=_save_zoom_mask,
                 inputs=[zoom_editor, zoom_state, mask_overrides],
@@ -200,6 +219,7 @@ def build_demo():
             force_exact = gr.Checkbox(value=True, label="输出固定尺寸（自动补边）")
             out_fmt_rs = gr.Dropdown(["PNG", "WEBP", "JPG"], value="PNG", label="输出格式")
             quality_rs = gr.Slider(50, 100, value=92, step=1, label="质量（JPG/WEBP 有效）")
+            preset_rs = gr.Dropdown(ENCODE_PRESETS, value=ENCODE_PRESET_DEFAULT, label="编码速度（fast 最快 / smallest 体积最小）")
 
             btn_rs = gr.Button("开始批量改尺寸")
             gallery_rs = gr.Gallery(label="结果预览", columns=4, height=360)
@@ -207,7 +227,7 @@ def build_demo():
             log_rs = gr.Textbox(label="日志", lines=6, value="等待点击", interactive=False)
 
             btn_rs.click(fn=batch_resize,
-                         inputs=[files_rs, w, h, mode, out_fmt_rs, quality_rs, pad_color, force_exact],
+                         inputs=[files_rs, w, h, mode, out_fmt_rs, quality_rs, pad_color, force_exact, preset_rs],
                          outputs=[gallery_rs, zip_rs, log_rs],
                          concurrency_limit=MAX_CONCURRENCY)
 
@@ -217,6 +237,7 @@ def build_demo():
                 out_fmt_cp = gr.Dropdown(COMPRESS_FORMAT_CHOICES, value=COMPRESS_FORMAT_AUTO, label="输出格式")
                 quality_cp = gr.Slider(50, 100, value=82, step=1, label="质量（JPG/WEBP 有效）")
                 jpg_bg_cp = gr.Dropdown(["white", "gray", "black"], value="white", label="JPG 背景色（JPG 输出用）")
+                preset_cp = gr.Dropdown(ENCODE_PRESETS, value=ENCODE_PRESET_DEFAULT, label="编码速度（fast 最快 / smallest 体积最小）")
 
             btn_cp = gr.Button("开始批量压缩")
             gallery_cp = gr.Gallery(label="结果预览", columns=4, height=360)
@@ -224,7 +245,7 @@ def build_demo():
             log_cp = gr.Textbox(label="日志", lines=6, value="等待点击", interactive=False)
 
             btn_cp.click(fn=batch_compress,
-                         inputs=[files_cp, out_fmt_cp, quality_cp, jpg_bg_cp],
+                         inputs=[files_cp, out_fmt_cp, quality_cp, jpg_bg_cp, preset_cp],
                          outputs=[gallery_cp, zip_cp, log_cp],
                          concurrency_limit=MAX_CONCURRENCY)
 